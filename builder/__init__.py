@@ -1,15 +1,23 @@
 import argparse
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import datetime
-import filecmp
+import json
 import os
+import posixpath
 import re
 import subprocess
 import sys
 import textwrap
 
+from builder import compress, css, fonts, images, javascript, sass, sizes
+from builder.cache import BuildCache
+from builder.deps import DependencyCache
+from builder.fingerprint import fingerprint_folder, load_manifest
 from builder.folders import DjangoAppPackage, GOVUKTemplate, GOVUKElements
-from builder.utils import announce_calls, one_line_doc, requisites, term_bold
+from builder.sync import sync_folders
+from builder.utils import announce_calls, check_call, file_lock, format_size, hash_paths, one_line_doc, profiler, \
+    requisites, term_bold
 
 commands = OrderedDict()
 
@@ -47,14 +55,84 @@ class Builder:
         self.parser = argparse.ArgumentParser(description=textwrap.dedent(self.__doc__).strip())
         self.parser.add_argument('command', choices=[option['name'] for option in commands.values()])
         self.parser.add_argument('--optimise-images', dest='should_optimise_images', action='store_true')
+        self.parser.add_argument('--modern-images', dest='modern_image_formats', action='store_const',
+                                 const=sorted(images.sibling_formats), default=[],
+                                 help='also write webp and avif versions of optimised images')
+        self.parser.add_argument('--responsive-images', dest='should_make_responsive_images', action='store_true',
+                                 help='also write resized and modern format variants of images for srcset')
+        self.parser.add_argument('--image-widths', metavar='WIDTHS', default='320,640,960',
+                                 help='comma-separated layout widths in css pixels to resize images to')
+        self.parser.add_argument('--image-densities', metavar='DENSITIES', default='1,2',
+                                 help='comma-separated device pixel ratios to resize images for at each width')
+        self.parser.add_argument('--cache-dir', dest='cache_path',
+                                 default=os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')),
+                                                      'django-moj-template'),
+                                 help='folder for caches shared between workspaces')
+        self.parser.add_argument('--govuk-template-ref', metavar='REF',
+                                 help='tag, branch or commit of GOV.UK Template to build, defaults to latest')
+        self.parser.add_argument('--govuk-elements-ref', metavar='REF',
+                                 help='tag, branch or commit of GOV.UK Elements to build, defaults to latest')
+        self.parser.add_argument('--offline', action='store_true',
+                                 help='build from cached source repositories without fetching')
+        self.parser.add_argument('--parallel', action='store_true',
+                                 help='update and build source repositories concurrently')
+        self.parser.add_argument('--purge-css', dest='should_purge_css', action='store_true',
+                                 help='also write a main.min.css without rules unused by templates')
+        self.parser.add_argument('--purge-css-templates', metavar='PATH', action='append', default=[],
+                                 help='additional template folder whose class names should be kept')
+        self.parser.add_argument('--purge-css-safelist', metavar='REGEX', action='append', default=[],
+                                 help='class or id names to always keep')
+        self.parser.add_argument('--size-budgets', dest='size_budgets_path', metavar='PATH',
+                                 default=os.path.join(root_path, 'asset-budgets.json'),
+                                 help='json file of asset size budgets, used if it exists')
+        self.parser.add_argument('--size-budget', metavar='PATTERN=SIZE', action='append', default=[],
+                                 help='size budget for each asset matching a pattern, e.g. stylesheets/*.css=30KB')
+        self.parser.add_argument('--total-size-budget', metavar='SIZE',
+                                 help='size budget for all assets together')
+        self.parser.add_argument('--no-cache', dest='use_build_cache', action='store_false',
+                                 help='rebuild every stage even if its inputs are unchanged')
+        self.parser.add_argument('--trace', dest='trace_path', default=os.path.join(root_path, 'build-trace.json'),
+                                 help='where to write build timings in chrome trace format')
         self.parser.add_argument('-v', '--verbose', action='store_true')
         args = self.parser.parse_args()
         self.command = args.command
         self.verbose = args.verbose
         self.should_optimise_images = args.should_optimise_images
+        self.modern_image_formats = args.modern_image_formats
+        self.should_make_responsive_images = args.should_make_responsive_images
+        try:
+            self.image_widths = [int(width) for width in args.image_widths.split(',')]
+            self.image_densities = [float(density) for density in args.image_densities.split(',')]
+        except ValueError:
+            self.parser.error('Image widths and densities must be comma-separated numbers')
+        self.cache_path = os.path.abspath(args.cache_path)
+        self.parallel = args.parallel
+        self.offline = args.offline
+        for repo in self.source_repositories:
+            repo.ref = getattr(args, '%s_ref' % repo.name)
+        self.trace_path = os.path.abspath(args.trace_path)
+        self.should_purge_css = args.should_purge_css
+        self.purge_css_templates = [os.path.abspath(path) for path in args.purge_css_templates]
+        self.purge_css_safelist = args.purge_css_safelist
+        self.size_budgets = self.get_size_budgets(args)
+
+        self.build_cache = BuildCache(os.path.join(self.src_path, '.build-cache.json'),
+                                      enabled=args.use_build_cache)
+        self.dependency_cache = DependencyCache(os.path.join(self.cache_path, 'deps'),
+                                                enabled=args.use_build_cache)
+        # keys of stages already run, later stages depend on earlier ones
+        # because they merge into the same package folders
+        self.stage_keys = []
 
     def main(self):
-        commands[self.command]['command'](self)
+        try:
+            commands[self.command]['command'](self)
+        finally:
+            if self.command == 'build':
+                self.dependency_cache.print_summary()
+                profiler.print_summary()
+                profiler.write_trace(self.trace_path)
+                print('Build trace written to %s' % os.path.relpath(self.trace_path))
 
     @command
     def help(self):
@@ -87,18 +165,89 @@ class Builder:
         check('bundler', '1.10', ['bundler', '--version'], r'Bundler version (\d+)\.(\d+)\.')
         check('npm', '3.7', ['npm', '--version'], r'(\d+)\.(\d+)\.')
         check('sass', '3.4', ['sass', '--version'], r'Sass (\d+)\.(\d+)\.')
+        check('msgfmt', '0.18', ['msgfmt', '--version'], r'msgfmt \(GNU gettext(?:-tools)?\) (\d+)\.(\d+)')
 
     def make_paths(self):
         self.make_paths(self.src_path, self.package.static_path, self.package.templates_path)
 
     @announce_calls('Updating source repositories')
     def update_source_repositories(self):
-        for repo in self.source_repositories:
-            if os.path.isdir(repo.path):
-                subprocess.check_call(['git', 'pull'], cwd=repo.path)
+        with ThreadPoolExecutor(max_workers=len(self.source_repositories)) as executor:
+            for future in [executor.submit(self.update_source_repository, repo) for repo in self.source_repositories]:
+                future.result()
+
+    def update_source_repository(self, repo):
+        """
+        Makes a shallow checkout of a repository, and its submodules, from a shared local mirror
+        """
+        mirror_path = self.update_git_mirror(repo.git_url)
+        self.checkout_from_mirror(repo.path, mirror_path, repo.ref or 'HEAD')
+        self.update_submodules(repo.path, repo.git_url)
+
+    def update_git_mirror(self, git_url):
+        """
+        Creates or updates a bare mirror of a remote repository in the cache folder, unless offline
+        :return: the mirror's path
+        """
+        name = re.sub(r'[^\w.-]+', '_', re.sub(r'^\w+://', '', git_url))
+        mirror_path = os.path.join(self.cache_path, 'git', name)
+        with file_lock(mirror_path + '.lock'):
+            if self.offline:
+                if not os.path.isdir(mirror_path):
+                    sys.exit('No cached copy of %s is available to build offline' % git_url)
+            elif os.path.isdir(mirror_path):
+                check_call(['git', 'fetch', '--prune', '--quiet'], cwd=mirror_path)
             else:
-                subprocess.check_call(['git', 'clone', '--recursive',
-                                      repo.git_url, repo.name], cwd=self.src_path)
+                # cloned under a temporary name and renamed so that a partial clone is never used
+                temp_path = '%s.%d.tmp' % (mirror_path, os.getpid())
+                self.rm_paths(temp_path)
+                check_call(['git', 'clone', '--mirror', '--quiet', git_url, temp_path])
+                os.rename(temp_path, mirror_path)
+        return mirror_path
+
+    @classmethod
+    def checkout_from_mirror(cls, path, mirror_path, ref):
+        if not os.path.isdir(os.path.join(path, '.git')):
+            cls.make_paths(path)
+            check_call(['git', 'init', '--quiet'], cwd=path)
+        check_call(['git', 'fetch', '--depth', '1', '--no-tags', '--quiet', 'file://' + mirror_path, ref], cwd=path)
+        check_call(['git', 'checkout', '--force', '--quiet', 'FETCH_HEAD'], cwd=path)
+
+    def update_submodules(self, path, git_url):
+        if not os.path.exists(os.path.join(path, '.gitmodules')):
+            return
+
+        def get_config(key_pattern):
+            try:
+                output = subprocess.check_output(['git', 'config', '--file', '.gitmodules', '--get-regexp',
+                                                  r'^submodule\..*\.%s$' % key_pattern], cwd=path)
+            except subprocess.CalledProcessError:
+                return {}
+            config = {}
+            for line in output.decode('utf-8').splitlines():
+                key, value = line.split(' ', 1)
+                config[key[len('submodule.'):-len(key_pattern) - 1]] = value
+            return config
+
+        submodule_paths = get_config('path')
+        submodule_urls = get_config('url')
+
+        def update_submodule(name):
+            submodule_url = submodule_urls[name]
+            if submodule_url.startswith('../'):
+                submodule_url = posixpath.normpath(posixpath.join(git_url, submodule_url))
+                submodule_url = re.sub(r'^(\w+:)/(?!/)', r'\1//', submodule_url)
+            mirror_path = self.update_git_mirror(submodule_url)
+            check_call(['git', 'config', 'submodule.%s.url' % name, 'file://' + mirror_path], cwd=path)
+            # file transport is disallowed for submodules by default since git 2.38
+            check_call(['git', '-c', 'protocol.file.allow=always', 'submodule', '--quiet', 'update',
+                        '--init', '--depth', '1', '--', submodule_paths[name]],
+                       cwd=path)
+            self.update_submodules(os.path.join(path, submodule_paths[name]), submodule_url)
+
+        with ThreadPoolExecutor(max_workers=max(len(submodule_paths), 1)) as executor:
+            for future in [executor.submit(update_submodule, name) for name in submodule_paths]:
+                future.result()
 
     @classmethod
     def fix_ruby_version(cls, path):
@@ -117,36 +266,137 @@ class Builder:
                 f.write('2.2.3')
 
     @command
-    @requisites(check_build_tools, make_paths, update_source_repositories)
+    @requisites(check_build_tools, make_paths)
     @announce_calls('Done', after_call=True)
     def build(self):
         """
         Builds the complete python package
         """
-        for repo in self.source_repositories:
+        if self.parallel:
+            # each repository is updated and built in its own checkout so they can proceed concurrently
+            with ThreadPoolExecutor(max_workers=len(self.source_repositories)) as executor:
+                futures = [
+                    executor.submit(self.update_and_build_source_repository, repo)
+                    for repo in self.source_repositories
+                ]
+                build_keys = [future.result() for future in futures]
+        else:
+            self.update_source_repositories()
+            build_keys = list(map(self.build_source_repository, self.source_repositories))
+
+        # built content is always merged in the same order so that precedence is unchanged
+        for repo, build_key in zip(self.source_repositories, build_keys):
+            self.merge_source_repository(repo, build_key)
+        self.build_sass()
+        self.create_django_app()
+        self.check_asset_sizes()
+
+    def is_stage_fresh(self, stage, key, *output_paths):
+        """
+        Checks whether a stage can be skipped, reusing previous outputs,
+        and otherwise forgets its recorded key until it completes again
+        """
+        if self.build_cache.is_fresh(stage, key, *output_paths):
+            print(term_bold('Inputs unchanged, reusing previous %s build' % stage))
+            return True
+        self.build_cache.invalidate(stage)
+        return False
+
+    def update_and_build_source_repository(self, repo):
+        self.update_source_repository(repo)
+        return self.build_source_repository(repo)
+
+    def build_source_repository(self, repo):
+        """
+        Builds a repository within its own checkout, returning the key of its inputs
+        """
+        key = self.build_cache.key(repo.get_head_commit())
+        if not self.is_stage_fresh(repo.name, key, *repo.get_build_output_paths()):
             getattr(self, 'build__%s' % repo.name)(repo)
+            self.build_cache.record(repo.name, key)
+        return key
 
-        if self.should_optimise_images:
-            self.optimise_images()
-        self.create_django_app()
+    def merge_source_repository(self, repo, build_key):
+        """
+        Copies a repository's built content into the package,
+        later merges depend on earlier ones as they can overwrite the same files
+        """
+        stage = '%s-merge' % repo.name
+        key = self.build_cache.key(build_key, *self.stage_keys)
+        self.stage_keys.append(key)
+        if not self.is_stage_fresh(stage, key, self.package.app_path):
+            getattr(self, 'merge__%s' % repo.name)(repo)
+            self.build_cache.record(stage, key)
 
     @announce_calls('Building gov.uk template')
     def build__govuk_template(self, repo):
         self.fix_ruby_version(repo.path)
-        subprocess.check_call(['bundle', 'install'], cwd=repo.path)
-        subprocess.check_call(['bundle', 'exec', 'rake', 'build:django'], cwd=repo.path)
+        # gems are installed within the checkout so that they can be cached
+        bundle_path = os.path.join(repo.path, 'vendor', 'bundle')
+        env = dict(os.environ, BUNDLE_PATH=bundle_path)
+        key = self.dependency_cache.key(repo.path, ['Gemfile', 'Gemfile.lock', '.ruby-version'], ['ruby', '--version'])
+        self.dependency_cache.install('bundler', key, bundle_path,
+                                      lambda: check_call(['bundle', 'install'], cwd=repo.path, env=env))
+        check_call(['bundle', 'exec', 'rake', 'build:django'], cwd=repo.path, env=env)
 
         if not repo.find_pkg_path():
             sys.exit('Could not find built package')
         if not repo.find_app_path():
             sys.exit('Cannot find built package app content')
 
+    @announce_calls('Merging gov.uk template')
+    def merge__govuk_template(self, repo):
+        if not repo.find_pkg_path() or not repo.find_app_path():
+            sys.exit('Cannot find built package app content')
+
         # copy built content
-        self.rsync_folders(repo.app_path, self.package.app_path)
+        self.sync_folders(repo.app_path, self.package.app_path)
+
+        self.fix_template_scripts(self.package.layout_template_paths[0])
+        self.fix_template_static(self.package.layout_template_paths[0])
+
+    @classmethod
+    def fix_template_scripts(cls, path):
+        """
+        Moves the layout's script into a block so that it can be replaced by a deferred bundle,
+        the check for it having loaded then needs to wait until deferred scripts have run
+        """
+        with open(path) as f:
+            template = f.read()
+        template, count = re.subn(r'<script\b[^>]*\bsrc="[^"]*javascripts/govuk-template\.js[^"]*"[^>]*>\s*</script>',
+                                  r'{% block javascript_bundles %}\g<0>{% endblock %}', template)
+        if not count:
+            print(term_bold('Cannot find govuk-template.js script in %s' % os.path.basename(path)))
+        template = re.sub(r'<script>\s*(if \(typeof window\.GOVUK === .undefined.\).*?;?)\s*</script>',
+                          r"<script>(function (check) {"
+                          r" if (document.addEventListener) document.addEventListener('DOMContentLoaded', check);"
+                          r" else window.attachEvent('onload', check);"
+                          r" })(function () { \1 });</script>",
+                          template, flags=re.S)
+        with open(path, 'w') as f:
+            f.write(template)
+
+    @classmethod
+    def fix_template_static(cls, path):
+        """
+        Refers to static files using moj_static so that the layout loads their content-hashed names
+        """
+        with open(path) as f:
+            template = f.read()
+        template = re.sub(r'{%\s*static\s', '{% moj_static ', template)
+        if not re.search(r'{%\s*load\s[^%]*\bdjango_moj_template\b', template):
+            match = re.search(r'{%\s*load\s[^%]*%}', template)
+            position = match.end() if match else 0
+            template = '%s{%% load django_moj_template %%}%s' % (template[:position], template[position:])
+        with open(path, 'w') as f:
+            f.write(template)
 
     @announce_calls('Building gov.uk elements')
     def build__govuk_elements(self, repo):
-        subprocess.check_call(['npm', 'install'], cwd=repo.path)
+        key = self.dependency_cache.key(repo.path, ['package.json', 'package-lock.json', 'npm-shrinkwrap.json'],
+                                        ['node', '--version'])
+        self.dependency_cache.install('npm', key, os.path.join(repo.path, 'node_modules'),
+                                      lambda: check_call(['npm', 'install'], cwd=repo.path))
 
         # build assets
         grunt_tasks = ['grunt']
@@ -160,27 +410,61 @@ class Builder:
             'replace',
             'sass',
         ])
-        subprocess.check_call(grunt_tasks, cwd=repo.path)
+        check_call(grunt_tasks, cwd=repo.path)
 
+    @announce_calls('Merging gov.uk elements')
+    def merge__govuk_elements(self, repo):
         # copy built content
-        self.rsync_folders_and_warn(repo.content_path, self.package.static_path,
-                                    'GOV.UK Elements overwrites %(count)d asset(s) from GOV.UK Template')
+        self.sync_folders_and_warn(repo.content_path, self.package.static_path,
+                                   'GOV.UK Elements overwrites %(count)d asset(s) from GOV.UK Template')
 
         # move sass files to assets folder (originating from govuk_frontend_toolkit?)
         self.rm_paths(self.package.assets_src_path)
-        subprocess.check_call([
+        check_call([
             'mv', os.path.join(self.package.static_path, 'sass'), self.package.assets_src_path
         ])
 
         # copy additional elements sass to assets folder
-        self.rsync_folders_and_warn(repo.elements_sass_path, self.package.assets_src_path,
-                                    'GOV.UK Elements build overwrites %(count)d asset(s)')
+        self.sync_folders_and_warn(repo.elements_sass_path, self.package.assets_src_path,
+                                   'GOV.UK Elements build overwrites %(count)d asset(s)')
 
-        # build sass files to static folder (originating from govuk_elements?)
         self.fix_sass_images_path(self.package.assets_src_path)
-        sass_paths = '.:%s' % self.package.stylesheets_path
-        subprocess.check_call(['sass', '--no-cache', '--sourcemap=none', '--update', sass_paths],
-                              cwd=self.package.assets_src_path)
+
+    @announce_calls('Building sass')
+    def build_sass(self):
+        """
+        Compiles each sass entry point into the static folder in its own worker,
+        skipping those whose imported files are unchanged since they were last compiled
+        """
+        graph = sass.SassGraph(os.path.join(self.src_path, '.sass-graph.json'), self.package.assets_src_path)
+        graph.update()
+        graph.save()
+
+        keys = []
+        outdated = []
+        for entry_point in graph.get_entry_points():
+            stage = 'sass:%s' % entry_point
+            key = graph.get_key(entry_point)
+            keys.append(key)
+            output_path = os.path.join(self.package.stylesheets_path, sass.get_output_name(entry_point))
+            if not self.build_cache.is_fresh(stage, key, output_path):
+                self.build_cache.invalidate(stage)
+                outdated.append((entry_point, output_path, stage, key))
+        self.stage_keys.append(self.build_cache.key(*keys))
+        if len(outdated) < len(keys):
+            print(term_bold('Inputs unchanged, reusing %d of %d compiled stylesheet(s)' %
+                            (len(keys) - len(outdated), len(keys))))
+
+        def compile_entry_point(entry_point, output_path, stage, key):
+            self.make_paths(os.path.dirname(output_path))
+            check_call(['sass', '--no-cache', '--sourcemap=none', '--load-path', '.',
+                        '%s:%s' % (entry_point, output_path)],
+                       cwd=self.package.assets_src_path)
+            self.build_cache.record(stage, key)
+
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            for future in [executor.submit(compile_entry_point, *target) for target in outdated]:
+                future.result()
 
     @classmethod
     def fix_sass_images_path(cls, path):
@@ -191,46 +475,325 @@ class Builder:
         with open(path, 'w') as f:
             f.write(helper_sass)
 
+    @announce_calls('Optimising images')
     def optimise_images(self):
         """
-        Use ImageOptim to optimise images on OS X only
-        https://imageoptim.com/
+        Losslessly recompresses images using optipng, jpegtran and gifsicle where installed
         """
-        if sys.platform != 'darwin':
-            return
-        try:
-            app_path = subprocess.check_output(['mdfind', 'kMDItemCFBundleIdentifier == "net.pornel.ImageOptim"'])
-        except subprocess.CalledProcessError:
+        tools = images.get_available_tools()
+        if not tools:
+            print(term_bold('No image optimisation tools found, install optipng, jpegtran and gifsicle'))
             return
-        app_path = app_path.strip().decode('utf-8').splitlines()
-        if not app_path:
-            return
-        app_path = app_path[0]
-        bin_path = '%s/Contents/MacOS/ImageOptim' % app_path
-        if not os.path.exists(bin_path):
+        formats = self.modern_image_formats
+        # hashed copies from a previous build are replaced when fingerprinting
+        hashed_paths = set(load_manifest(self.package.manifest_path).values())
+        image_paths = [
+            path for path in images.find_images(self.package.images_path, self.package.stylesheets_path)
+            if os.path.relpath(path, self.package.static_path).replace(os.sep, '/') not in hashed_paths
+        ]
+        results = images.optimise_images(image_paths, os.path.join(self.cache_path, 'images'), formats)
+        total_size = total_saved = 0
+        for path, size, optimised_size, from_cache in results:
+            total_size += size
+            total_saved += size - optimised_size
+            if self.verbose or size != optimised_size:
+                print('  %s: %d → %d bytes%s' % (os.path.relpath(path, self.package.static_path), size,
+                                                 optimised_size, ' (cached)' if from_cache else ''))
+        print('Saved %d of %d bytes in %d image(s)' % (total_saved, total_size, len(results)))
+
+    @announce_calls('Making responsive images')
+    def make_responsive_images(self):
+        """
+        Writes resized and modern format variants of images and an index of them
+        that the responsive_image template tag uses to build srcset attributes
+        """
+        if images.Image is None:
+            print(term_bold('Pillow is not installed, responsive images will not be made'))
             return
-
-        print(term_bold('Optimising images… this may take a while!'))
-        subprocess.check_call([bin_path, self.package.images_path, self.package.stylesheets_path])
+        hashed_paths = set(load_manifest(self.package.manifest_path).values())
+        image_paths = [
+            path for path in images.find_resizable_images(self.package.images_path)
+            if os.path.relpath(path, self.package.static_path).replace(os.sep, '/') not in hashed_paths
+        ]
+        results = images.make_responsive_images(image_paths, os.path.join(self.cache_path, 'images', 'responsive'),
+                                                self.image_widths, self.image_densities)
+
+        def relative_path(path):
+            return os.path.relpath(path, self.package.static_path).replace(os.sep, '/')
+
+        index = {}
+        for path, width, height, variants in results:
+            sources = OrderedDict()
+            for variant_path, variant_width, content_type, _ in variants:
+                sources.setdefault(content_type, []).append([relative_path(variant_path), variant_width])
+            index[relative_path(path)] = {'width': width, 'height': height, 'sources': sources}
+            if self.verbose:
+                print('  %s: %d variant(s)' % (relative_path(path), len(variants) - 1))
+        with open(self.package.responsive_images_path, 'w') as f:
+            json.dump({'version': 1, 'images': index}, f, indent=2, sort_keys=True)
+        print('Wrote %d variant(s) of %d image(s)' % (sum(len(result[3]) - 1 for result in results), len(results)))
 
     @announce_calls('Creating Django app')
     def create_django_app(self):
+        key = self.build_cache.key(hash_paths(self.template_path, *self.purge_css_templates),
+                                   self.should_purge_css, self.should_optimise_images, self.modern_image_formats,
+                                   compress.brotli is not None, bool(javascript.get_uglifyjs()), fonts.is_available(),
+                                   self.should_make_responsive_images, self.image_widths, self.image_densities,
+                                   [name for name, _, _ in images.get_modern_formats()],
+                                   sorted(images.get_available_tools()) if self.should_optimise_images else None,
+                                   *self.purge_css_safelist + self.stage_keys)
+        if self.is_stage_fresh('django_app', key, self.package.build_flag_path):
+            return
+
         # add templated files
-        self.rsync_folders(self.template_path, self.package.path)
+        self.sync_folders(self.template_path, self.package.path)
 
         # tidy up
-        subprocess.check_call(['find', '.',
-                               '-name', '.DS_Store', '-or',
-                               '-name', '*.mo', '-or',
-                               '-name', '*.py?', '-or',
-                               '-path', '"*/.sass-cache*"',
-                               '-delete'],
-                              cwd=self.package.path)
+        check_call(['find', '.',
+                    '-name', '.DS_Store', '-or',
+                    '-name', '*.py?', '-or',
+                    '-path', '"*/.sass-cache*"',
+                    '-delete'],
+                   cwd=self.package.path)
+
+        if self.should_optimise_images:
+            self.optimise_images()
+        self.compile_messages()
+        self.subset_fonts()
+        if self.should_make_responsive_images:
+            self.make_responsive_images()
+        else:
+            self.rm_paths(self.package.responsive_images_path)
+        if self.should_purge_css:
+            self.purge_unused_css()
+        self.extract_critical_css()
+        self.bundle_javascripts()
+        self.fingerprint_static_files()
+        self.precompress_static_files()
 
         # mark build as complete
         with open(self.package.build_flag_path, 'w') as f:
             f.write(str(datetime.datetime.now()))
 
+        self.build_cache.record('django_app', key)
+
+    @announce_calls('Compiling translations')
+    def compile_messages(self):
+        """
+        Compiles and validates gettext catalogs so that the package ships .mo files
+        """
+        for dir_path, dir_names, file_names in os.walk(self.package.locale_path):
+            for file_name in file_names:
+                if not file_name.endswith('.po'):
+                    continue
+                po_path = os.path.join(dir_path, file_name)
+                print('  %s' % os.path.relpath(po_path, self.package.locale_path))
+                check_call(['msgfmt', '--check', '--statistics',
+                            '-o', re.sub(r'\.po$', '.mo', po_path), po_path])
+
+    @announce_calls('Subsetting fonts')
+    def subset_fonts(self):
+        """
+        Reduces fonts to the characters needed by english and the packaged translations, as woff2
+        """
+        if not fonts.is_available():
+            print(term_bold('fonttools and brotli are not installed, fonts will not be subset'))
+            return
+        languages = ['en']
+        if os.path.isdir(self.package.locale_path):
+            languages.extend(sorted(os.listdir(self.package.locale_path)))
+        codepoints = fonts.get_codepoints(languages, self.package.locale_path)
+
+        # hashed copies from a previous build are replaced when fingerprinting
+        hashed_paths = set(load_manifest(self.package.manifest_path).values())
+        stylesheet_paths = []
+        for dir_path, dir_names, file_names in os.walk(self.package.stylesheets_path):
+            for file_name in sorted(file_names):
+                path = os.path.join(dir_path, file_name)
+                relative_path = os.path.relpath(path, self.package.static_path).replace(os.sep, '/')
+                if file_name.endswith('.css') and relative_path not in hashed_paths:
+                    stylesheet_paths.append(path)
+
+        results = fonts.subset_stylesheets(stylesheet_paths, codepoints, os.path.join(self.cache_path, 'fonts'))
+        for path, size, subset_size, from_cache in results:
+            print('  %s: %d → %d bytes%s' % (os.path.relpath(path, self.package.static_path), size, subset_size,
+                                             ' (cached)' if from_cache else ''))
+        print('Subset %d font(s) to %d characters, %d → %d bytes' % (
+            len(results), len(codepoints), sum(result[1] for result in results), sum(result[2] for result in results),
+        ))
+
+    @announce_calls('Purging unused css')
+    def purge_unused_css(self):
+        used_tokens = css.collect_used_tokens(self.package.templates_path, self.package.javascripts_path,
+                                              *self.purge_css_templates)
+        for name in ('main',):
+            src_path = os.path.join(self.package.stylesheets_path, '%s.css' % name)
+            target_path = os.path.join(self.package.stylesheets_path, '%s.min.css' % name)
+            with open(src_path) as f:
+                content = f.read()
+            purged_content = css.purge_css(content, used_tokens, self.purge_css_safelist)
+            with open(target_path, 'w') as f:
+                f.write(purged_content)
+            content, purged_content = content.encode('utf-8'), purged_content.encode('utf-8')
+            print('%s.min.css: %d → %d bytes (%d%% saved, %d → %d gzipped)' % (
+                name, len(content), len(purged_content),
+                100 - 100 * len(purged_content) // max(len(content), 1),
+                len(compress.gzip_compress(content)), len(compress.gzip_compress(purged_content)),
+            ))
+
+    @announce_calls('Extracting critical css')
+    def extract_critical_css(self):
+        """
+        Keeps the rules needed by the page chrome of the base layout alone,
+        i.e. header, proposition header, phase banner and footer, for inlining in the page head
+        """
+        used_tokens = css.collect_used_tokens(*self.package.layout_template_paths)
+        used_elements = css.collect_used_elements(*self.package.layout_template_paths)
+        src_path = os.path.join(self.package.stylesheets_path, 'main.css')
+        target_path = os.path.join(self.package.stylesheets_path, 'main.critical.css')
+        with open(src_path) as f:
+            content = f.read()
+        critical_content = css.extract_critical_css(content, used_tokens, used_elements)
+        with open(target_path, 'w') as f:
+            f.write(critical_content)
+        print('main.critical.css: %d bytes' % len(critical_content.encode('utf-8')))
+
+    @announce_calls('Bundling javascript')
+    def bundle_javascripts(self):
+        """
+        Combines packaged scripts into bundles with source maps, minified if uglifyjs 3 is installed
+        """
+        uglifyjs = javascript.get_uglifyjs()
+        if not uglifyjs:
+            print(term_bold('uglifyjs 3 is not installed, bundles will not be minified'))
+        for name, patterns in javascript.bundles.items():
+            source_paths = javascript.find_bundle_sources(self.package.javascripts_path, patterns)
+            if not source_paths:
+                print(term_bold('No scripts found for %s bundle' % name))
+                continue
+            bundle_path = javascript.bundle_scripts(self.package.javascripts_path, name, source_paths, uglifyjs)
+            source_size = sum(os.path.getsize(os.path.join(self.package.javascripts_path, path))
+                              for path in source_paths)
+            bundle_size = os.path.getsize(os.path.join(self.package.javascripts_path, bundle_path))
+            print('%s: %d script(s), %d → %d bytes' % (bundle_path, len(source_paths), source_size, bundle_size))
+
+    def find_preload_assets(self):
+        """
+        Finds the stylesheets and scripts the layout templates load in all modern browsers,
+        i.e. not within conditional comments, and the regular and bold fonts they use
+        """
+        assets = []
+        contents = []
+        for template_path in self.package.layout_template_paths:
+            with open(template_path) as f:
+                contents.append(f.read())
+        for index, content in enumerate(contents):
+            # drop the default content of blocks that extending layouts replace
+            for block_name in set(re.findall(r'{%\s*block\s+(\w+)\s*%}', ''.join(contents[index + 1:]))):
+                content = re.sub(r'({%%\s*block\s+%s\s*%%}).*?({%%\s*endblock\b)' % block_name, r'\1\2', content,
+                                 flags=re.S)
+            # drop sections only for old versions of internet explorer, keeping <!--[if gt IE 8]><!--> ones
+            content = re.sub(r'<!--\[if[^\]]*\]>(?!<!-->).*?<!\[endif\]-->', '', content, flags=re.S)
+            paths = re.findall(r'''{%\s*(?:static|moj_static|critical_stylesheet)\s+['"]([^'"]+\.(?:css|js))['"]''',
+                               content)
+            paths.extend('javascripts/%s%s' % (name, javascript.bundle_suffix)
+                         for name in re.findall(r'''{%\s*javascript_bundle\s+['"]([^'"]+)['"]''', content))
+            for path in paths:
+                asset = {'path': path, 'as': 'style' if path.endswith('.css') else 'script'}
+                if asset not in assets:
+                    assets.append(asset)
+
+        for asset in list(assets):
+            stylesheet_path = os.path.join(self.package.static_path, asset['path'])
+            if asset['as'] != 'style' or not os.path.exists(stylesheet_path):
+                continue
+            with open(stylesheet_path) as f:
+                font_urls = css.find_font_urls(f.read())
+            for url in font_urls:
+                if 'tabular' in url:
+                    continue
+                path = posixpath.normpath(posixpath.join(posixpath.dirname(asset['path']), url))
+                assets.append({'path': path, 'as': 'font'})
+        return assets
+
+    @announce_calls('Fingerprinting static files')
+    def fingerprint_static_files(self):
+        hashed_paths = fingerprint_folder(self.package.static_path, self.package.manifest_path,
+                                          preload=self.find_preload_assets())
+        print('Wrote %d hashed file name(s) to %s' % (len(hashed_paths),
+                                                     os.path.relpath(self.package.manifest_path, self.root_path)))
+
+    @announce_calls('Precompressing static files')
+    def precompress_static_files(self):
+        if not compress.brotli:
+            print(term_bold('brotli is not installed, only gzip variants will be written'))
+        results = compress.precompress_folder(self.package.static_path)
+        total_size = sum(size for _, size, _ in results)
+        for suffix, _ in compress.get_encodings():
+            compressed_size = sum(variants.get(suffix, size) for _, size, variants in results)
+            print('%s: %d file(s), %d → %d bytes' % (suffix, len(results), total_size, compressed_size))
+
+    def get_size_budgets(self, args):
+        if os.path.exists(args.size_budgets_path):
+            try:
+                budgets = sizes.load_budgets(args.size_budgets_path)
+            except ValueError as e:
+                self.parser.error('Cannot use size budgets in %s: %s' % (args.size_budgets_path, e))
+        else:
+            budgets = {'compression': 'gzip', 'assets': {}, 'totals': {}}
+        try:
+            for budget in args.size_budget:
+                pattern, size = budget.rsplit('=', 1)
+                budgets['assets'][pattern] = sizes.parse_size(size)
+            if args.total_size_budget:
+                budgets['totals']['*'] = sizes.parse_size(args.total_size_budget)
+        except ValueError:
+            self.parser.error('Size budgets must be given as PATTERN=SIZE and sizes as bytes, KB or MB')
+        return budgets
+
+    @announce_calls('Checking asset sizes')
+    def check_asset_sizes(self, top_count=10):
+        """
+        Writes the raw and compressed size of every static file, reports the largest changes
+        since the previous build and fails if any size budget is exceeded
+        """
+        compression = self.size_budgets['compression']
+        asset_sizes = sizes.measure_assets(self.package.static_path, self.package.manifest_path)
+        previous_sizes = sizes.load_sizes(self.package.sizes_path)
+        sizes.save_sizes(self.package.sizes_path, asset_sizes)
+
+        for name, _ in sizes.compressions:
+            total = sum(size[name] or 0 for size in asset_sizes.values())
+            if any(size[name] is None for size in asset_sizes.values()):
+                continue
+            line = '%s: %s in %d file(s)' % (name, format_size(total), len(asset_sizes))
+            if previous_sizes:
+                previous_total = sum(size.get(name) or 0 for size in previous_sizes.values())
+                line += ' (%+d bytes since previous build)' % (total - previous_total)
+            print(line)
+
+        if previous_sizes:
+            changes = sizes.get_size_changes(asset_sizes, previous_sizes, compression)
+            growers = [change for change in changes if (change[2] or 0) > (change[1] or 0)]
+            if growers:
+                print('Largest %s size increases:' % compression)
+            for path, previous_size, size in growers[:top_count]:
+                if previous_size is None:
+                    print('  %s: new, %s' % (path, format_size(size)))
+                else:
+                    print('  %s: %s → %s (%+d bytes)' % (path, format_size(previous_size), format_size(size),
+                                                          size - previous_size))
+            if len(changes) > len(growers[:top_count]):
+                print('  and %d other change(s), see %s' % (len(changes) - len(growers[:top_count]),
+                                                            os.path.relpath(self.package.sizes_path, self.root_path)))
+
+        exceeded = sizes.check_budgets(asset_sizes, self.size_budgets)
+        if exceeded:
+            sys.exit('Size budgets exceeded (%s):\n%s' % (compression, '\n'.join(
+                '  %s: %s, budget %s' % (description, format_size(size), format_size(budget))
+                for description, size, budget in exceeded
+            )))
+
     # PUBLISHING
 
     @command
@@ -241,8 +804,8 @@ class Builder:
         """
         if not os.path.exists(self.package.build_flag_path):
             sys.exit('Run the build command first before trying to publish')
-        subprocess.check_call(['python', 'setup.py', 'sdist', 'upload'],
-                              cwd=self.package.path)
+        check_call(['python', 'setup.py', 'sdist', 'upload'],
+                   cwd=self.package.path)
 
     # CLEANING
 
@@ -267,36 +830,22 @@ class Builder:
         for path in paths:
             if not os.path.exists(path):
                 continue
-            subprocess.check_call(['rm', '-rf', path])
+            check_call(['rm', '-rf', path])
 
     @classmethod
-    def rsync_folders(cls, src_path, target_path):
-        subprocess.check_call(['rsync', '-r', src_path.rstrip('/') + '/', target_path.rstrip('/')])
+    def sync_folders(cls, src_path, target_path):
+        return sync_folders(src_path, target_path)
 
     @classmethod
-    def diff_folders(cls, src_root_path, target_root_path, track_new=True):
-        differences = []
-        for dir_path, dir_names, file_names in os.walk(src_root_path):
-            relative_dir_path = os.path.relpath(dir_path, src_root_path)
-            target_dir_path = os.path.abspath(os.path.join(target_root_path, relative_dir_path))
-            for file_name in file_names:
-                relative_file_path = os.path.join(relative_dir_path, file_name)
-                src_file_path = os.path.join(dir_path, file_name)
-                target_file_path = os.path.join(target_dir_path, file_name)
-                if not os.path.exists(target_file_path):
-                    if track_new:
-                        differences.append((relative_file_path, 'new'))
-                elif not filecmp.cmp(src_file_path, target_file_path):
-                    differences.append((relative_file_path, 'modified'))
-        return differences
-
-    @classmethod
-    def rsync_folders_and_warn(cls, src_path, target_path, message):
-        differences = cls.diff_folders(src_path, target_path, track_new=False)
+    def sync_folders_and_warn(cls, src_path, target_path, message):
+        differences = [
+            difference
+            for difference in cls.sync_folders(src_path, target_path)
+            if difference[1] == 'modified'
+        ]
         if differences:
             print(term_bold(message % {
                 'count': len(differences)
             }))
             for difference in differences:
                 print('  %s' % difference[0])
-        cls.rsync_folders(src_path, target_path)
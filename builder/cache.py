@@ -0,0 +1,66 @@
+import hashlib
+import json
+import os
+import threading
+
+
+class BuildCache:
+    """
+    Persistent record of the inputs each build stage last ran with
+    so that stages whose inputs are unchanged can be skipped
+    """
+
+    def __init__(self, path, enabled=True):
+        self.path = path
+        self.enabled = enabled
+        self.stages = {}
+        self.lock = threading.Lock()
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self.stages = json.load(f)
+            except ValueError:
+                self.stages = {}
+
+    @classmethod
+    def key(cls, *parts):
+        """
+        Returns a digest of the given input parts
+        :param parts: strings identifying stage inputs, e.g. commits or content hashes
+        """
+        digest = hashlib.sha1()
+        for part in parts:
+            digest.update(str(part).encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def is_fresh(self, stage, key, *output_paths):
+        """
+        Returns whether a stage last ran with the same key and its outputs still exist
+        :param stage: name of the build stage
+        :param key: digest of the stage's current inputs
+        :param output_paths: paths the stage is expected to have produced
+        """
+        if not self.enabled or self.stages.get(stage) != key:
+            return False
+        return all(path and os.path.exists(path) for path in output_paths)
+
+    def record(self, stage, key):
+        """
+        Saves the key a stage successfully ran with
+        :param stage: name of the build stage
+        :param key: digest of the stage's inputs
+        """
+        with self.lock:
+            self.stages[stage] = key
+            self.save()
+
+    def invalidate(self, stage):
+        with self.lock:
+            if self.stages.pop(stage, None) is not None:
+                self.save()
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), 0o755, exist_ok=True)
+        with open(self.path, 'w') as f:
+            json.dump(self.stages, f, indent=2, sort_keys=True)
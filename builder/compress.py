@@ -0,0 +1,74 @@
+from concurrent.futures import ProcessPoolExecutor
+import gzip
+import os
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+compressible_extensions = ('.css', '.js', '.svg', '.json', '.map', '.txt', '.html', '.xml',
+                           '.ico', '.eot', '.ttf', '.otf')
+
+
+def get_encodings():
+    encodings = [('.gz', gzip_compress)]
+    if brotli is not None:
+        encodings.append(('.br', brotli_compress))
+    return encodings
+
+
+def gzip_compress(content):
+    return gzip.compress(content, compresslevel=9)
+
+
+def brotli_compress(content):
+    return brotli.compress(content, quality=11)
+
+
+def precompress_folder(root_path, max_workers=None):
+    """
+    Writes gzip and, if the brotli module is installed, brotli variants next to every compressible file
+    :param root_path: folder to search for compressible files
+    :param max_workers: number of compressing processes, defaults to the number of CPUs
+    :return: list of (relative path, original size, {suffix: compressed size})
+    """
+    paths = []
+    for dir_path, dir_names, file_names in os.walk(root_path):
+        for file_name in file_names:
+            if file_name.lower().endswith(compressible_extensions):
+                paths.append(os.path.join(dir_path, file_name))
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(precompress_file, paths, chunksize=16))
+    return [
+        (os.path.relpath(path, root_path), size, variants)
+        for path, (size, variants) in zip(paths, results)
+    ]
+
+
+def precompress_file(path):
+    """
+    Compresses one file, keeping only variants that are smaller than the original
+    and skipping variants newer than the original
+    """
+    stat = os.stat(path)
+    content = None
+    variants = {}
+    for suffix, compress in get_encodings():
+        variant_path = path + suffix
+        if os.path.exists(variant_path) and os.stat(variant_path).st_mtime >= stat.st_mtime:
+            variants[suffix] = os.stat(variant_path).st_size
+            continue
+        if content is None:
+            with open(path, 'rb') as f:
+                content = f.read()
+        compressed = compress(content)
+        if len(compressed) >= len(content):
+            if os.path.exists(variant_path):
+                os.remove(variant_path)
+            continue
+        with open(variant_path, 'wb') as f:
+            f.write(compressed)
+        variants[suffix] = len(compressed)
+    return stat.st_size, variants
@@ -0,0 +1,270 @@
+import os
+import re
+
+token_re = re.compile(r'[A-Za-z_][\w-]*')
+selector_class_re = re.compile(r'([.#])(-?[A-Za-z_][\w-]*)')
+selector_ignored_re = re.compile(r':not\([^)]*\)|\[[^\]]*\]|::?[\w-]+(\([^)]*\))?')
+selector_type_re = re.compile(r'(?:^|[\s>+~])([A-Za-z][\w-]*)')
+element_re = re.compile(r'<([A-Za-z][\w-]*)')
+# at-rules whose blocks contain rules rather than declarations
+grouping_at_rules = ('@media', '@supports', '@document', '@-moz-document')
+default_safelist = [r'^js-', r'^no-js']
+css_url_re = re.compile(r'''url\(\s*(?P<quote>['"]?)(?P<url>.*?)(?P=quote)\s*\)''')
+css_import_re = re.compile(r'''@import\s+(?P<quote>['"])(?P<url>[^'"]*)(?P=quote)''', re.I)
+font_face_re = re.compile(r'@font-face\s*{(?P<body>[^}]*)}', re.I)
+font_src_re = re.compile(r'(?P<prefix>(?:^|;)\s*src\s*:\s*)(?P<value>[^;]*)', re.I)
+
+
+def parse_css(css):
+    """
+    Splits a stylesheet into a list of (prelude, body) pairs where body is
+    None for statements like @import or the text inside the braces for blocks
+    """
+    items = []
+    prelude_start = 0
+    depth = 0
+    body_start = None
+    index = 0
+    length = len(css)
+    while index < length:
+        char = css[index]
+        if char == '/' and css.startswith('/*', index):
+            end = css.find('*/', index + 2)
+            if end == -1:
+                break
+            if depth == 0 and prelude_start == index:
+                prelude_start = end + 2
+            index = end + 2
+            continue
+        if char in '"\'':
+            index = find_string_end(css, index)
+            continue
+        if char == '{':
+            if depth == 0:
+                body_start = index + 1
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                items.append((strip_comments(css[prelude_start:body_start - 1]).strip(), css[body_start:index]))
+                prelude_start = index + 1
+        elif char == ';' and depth == 0:
+            items.append((strip_comments(css[prelude_start:index]).strip(), None))
+            prelude_start = index + 1
+        index += 1
+    return items
+
+
+def find_string_end(css, index):
+    quote = css[index]
+    index += 1
+    while index < len(css):
+        if css[index] == '\\':
+            index += 2
+            continue
+        if css[index] == quote:
+            return index + 1
+        index += 1
+    return index
+
+
+def strip_comments(css):
+    return re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+
+
+def minify_declarations(body):
+    parts = []
+    index = 0
+    body = strip_comments(body)
+    for match in re.finditer(r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'', body):
+        parts.append(_minify_whitespace(body[index:match.start()]))
+        parts.append(match.group(0))
+        index = match.end()
+    parts.append(_minify_whitespace(body[index:]))
+    return ''.join(parts).strip().rstrip(';')
+
+
+def _minify_whitespace(css):
+    css = re.sub(r'\s+', ' ', css)
+    return re.sub(r'\s*([;:,{}])\s*', r'\1', css)
+
+
+def collect_used_tokens(*paths, extensions=('.html', '.txt', '.js', '.py')):
+    """
+    Collects every identifier-like word from the given files or files under the given folders,
+    a deliberately broad notion of "used" so class names built in templates or scripts are kept
+    """
+    file_paths = []
+    for root_path in paths:
+        if os.path.isfile(root_path):
+            file_paths.append(root_path)
+            continue
+        for dir_path, dir_names, file_names in os.walk(root_path):
+            file_paths.extend(
+                os.path.join(dir_path, file_name)
+                for file_name in file_names
+                if file_name.endswith(extensions)
+            )
+    tokens = set()
+    for file_path in file_paths:
+        with open(file_path, encoding='utf-8', errors='ignore') as f:
+            tokens.update(token_re.findall(f.read()))
+    return tokens
+
+
+def collect_used_elements(*paths):
+    """
+    Collects the names of the html elements found in the given templates
+    """
+    elements = set()
+    for path in paths:
+        with open(path, encoding='utf-8', errors='ignore') as f:
+            elements.update(name.lower() for name in element_re.findall(f.read()))
+    return elements
+
+
+def is_selector_used(selector, used_tokens, safelist, used_elements=None):
+    """
+    Checks whether every class and id a selector refers to is used and,
+    if used_elements is given, every element type too
+    """
+    selector = selector_ignored_re.sub('', selector)
+    for _, name in selector_class_re.findall(selector):
+        if name not in used_tokens and not any(pattern.search(name) for pattern in safelist):
+            return False
+    if used_elements is not None:
+        for name in selector_type_re.findall(selector):
+            if name.lower() not in used_elements:
+                return False
+    return True
+
+
+def split_selectors(prelude):
+    """
+    Splits a selector list on its commas, leaving those within e.g. :not(a, b) or :is() alone
+    """
+    selectors = []
+    depth = 0
+    start = 0
+    for index, char in enumerate(prelude):
+        if char in '([':
+            depth += 1
+        elif char in ')]':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            selectors.append(prelude[start:index])
+            start = index + 1
+    selectors.append(prelude[start:])
+    return [selector.strip() for selector in selectors if selector.strip()]
+
+
+def get_prefix_safelist(used_tokens):
+    """
+    Words ending in a hyphen are usually completed dynamically, e.g. phase-banner-{{ phase }},
+    so any name starting with them is kept
+    """
+    return [re.compile('^%s' % re.escape(token)) for token in used_tokens if token.endswith('-')]
+
+
+def purge_css(css, used_tokens, safelist=()):
+    """
+    Removes rules whose selectors all refer to classes or ids that are not used, minifying what remains
+    :param css: stylesheet text
+    :param used_tokens: set of class and id names that are used
+    :param safelist: regular expressions for names that are always kept
+    """
+    safelist = [re.compile(pattern) for pattern in list(safelist) + default_safelist]
+    safelist.extend(get_prefix_safelist(used_tokens))
+    return _purge_items(parse_css(css), used_tokens, safelist)
+
+
+def extract_critical_css(css, used_tokens, used_elements):
+    """
+    Keeps only the rules whose selectors match classes, ids and elements found in a layout,
+    dropping @font-face, @import and other at-rules along with print styles as the full stylesheet provides them
+    :param css: stylesheet text
+    :param used_tokens: set of class and id names in the layout
+    :param used_elements: set of element names in the layout, see collect_used_elements
+    """
+    safelist = [re.compile(pattern) for pattern in default_safelist]
+    safelist.extend(get_prefix_safelist(used_tokens))
+    return _purge_items(parse_css(css), used_tokens, safelist, used_elements)
+
+
+def _purge_items(items, used_tokens, safelist, used_elements=None):
+    # extracting critical css also restricts element types and drops statements and non-grouping at-rules
+    critical = used_elements is not None
+    output = []
+    for prelude, body in items:
+        if body is None:
+            if prelude and not critical:
+                output.append(prelude + ';')
+        elif prelude.startswith(grouping_at_rules):
+            if critical and re.match(r'@media\s+(only\s+)?print\b', prelude, flags=re.I):
+                continue
+            inner = _purge_items(parse_css(body), used_tokens, safelist, used_elements)
+            if inner:
+                output.append('%s{%s}' % (re.sub(r'\s+', ' ', prelude), inner))
+        elif prelude.startswith('@'):
+            # @font-face, @keyframes, @page etc. are kept as they are
+            if not critical:
+                output.append('%s{%s}' % (re.sub(r'\s+', ' ', prelude), minify_css(body)))
+        else:
+            selectors = [
+                selector
+                for selector in split_selectors(prelude)
+                if is_selector_used(selector, used_tokens, safelist, used_elements)
+            ]
+            if selectors:
+                output.append('%s{%s}' % (','.join(re.sub(r'\s+', ' ', selector) for selector in selectors),
+                                          minify_declarations(body)))
+    return ''.join(output)
+
+
+def minify_css(css):
+    """
+    Minifies a stylesheet or at-rule body without removing anything
+    """
+    if '{' not in css:
+        return minify_declarations(css)
+    items = parse_css(css)
+    return ''.join(
+        '%s;' % prelude if body is None else '%s{%s}' % (re.sub(r'\s+', ' ', prelude), minify_css(body))
+        for prelude, body in items
+    )
+
+
+def find_urls(css):
+    """
+    Returns the relative urls referred to by a stylesheet without query strings or fragments
+    """
+    urls = []
+    for match in css_url_re.finditer(css):
+        url = re.sub(r'[?#].*$', '', match.group('url'))
+        if url and not url.startswith(('data:', '/')) and '//' not in url:
+            urls.append(url)
+    return urls
+
+
+def split_font_sources(value):
+    """
+    Splits the value of an @font-face src descriptor into its comma-separated sources
+    """
+    return [source.strip() for source in re.split(r',(?![^()]*\))', value) if source.strip()]
+
+
+def find_font_urls(css):
+    """
+    Returns the relative url of the font that browsers supporting woff or woff2 use for each @font-face
+    """
+    urls = []
+    for font_face in font_face_re.finditer(css):
+        src_matches = list(font_src_re.finditer(font_face.group('body')))
+        if not src_matches:
+            continue
+        for source in split_font_sources(src_matches[-1].group('value')):
+            font_urls = find_urls(source)
+            if font_urls and re.search(r'\.woff2?$', font_urls[0]):
+                urls.append(font_urls[0])
+                break
+    return urls
@@ -0,0 +1,152 @@
+import os
+import platform
+import shutil
+import subprocess
+import threading
+
+from builder.cache import BuildCache
+from builder.utils import file_lock, format_size
+
+key_file_name = '.build-deps-key'
+
+
+class DependencyCache:
+    """
+    Content-addressed copies of installed dependency folders, e.g. node_modules,
+    keyed on the lockfiles that determine their contents so that installs can be skipped
+    """
+
+    def __init__(self, path, enabled=True, keep=3):
+        """
+        :param path: folder holding one copy per kind and key
+        :param enabled: whether to restore from the cache, new installs are still saved
+        :param keep: number of copies to keep of each kind
+        """
+        self.path = path
+        self.enabled = enabled
+        self.keep = keep
+        self.hits = []
+        self.misses = []
+        self.lock = threading.Lock()
+
+    @classmethod
+    def key(cls, path, lockfile_names, version_cmd=None):
+        """
+        Returns a digest of the lockfiles present in a checkout, the platform and optionally a tool's version
+        :param path: checkout containing the lockfiles
+        :param lockfile_names: names of files that determine what is installed
+        :param version_cmd: command printing the version of the runtime dependencies are built for
+        """
+        parts = [platform.system(), platform.machine()]
+        if version_cmd:
+            parts.append(subprocess.check_output(version_cmd).decode('utf-8').strip())
+        for lockfile_name in lockfile_names:
+            lockfile_path = os.path.join(path, lockfile_name)
+            if os.path.exists(lockfile_path):
+                with open(lockfile_path, 'rb') as f:
+                    parts.extend([lockfile_name, f.read()])
+        return BuildCache.key(*parts)
+
+    def install(self, kind, key, target_path, install):
+        """
+        Restores a dependency folder from the cache if possible,
+        otherwise runs the install and saves the resulting folder
+        :param kind: name of the kind of dependencies, e.g. npm
+        :param key: digest of the lockfiles
+        :param target_path: folder the install writes to
+        :param install: callable performing the install
+        """
+        cached_path = os.path.join(self.path, '%s-%s' % (kind, key))
+        if self.enabled and read_key(target_path) == key:
+            self.add_hit(kind, target_path, 'already installed')
+            return
+        # other builds sharing the cache folder may be restoring or pruning copies of the same kind
+        lock_path = os.path.join(self.path, '%s.lock' % kind)
+        if self.enabled:
+            with file_lock(lock_path):
+                restored = os.path.isdir(cached_path)
+                if restored:
+                    if os.path.lexists(target_path):
+                        shutil.rmtree(target_path)
+                    shutil.copytree(cached_path, target_path, symlinks=True)
+                    os.utime(cached_path)
+            if restored:
+                self.add_hit(kind, target_path, 'restored from cache')
+                return
+
+        remove_key(target_path)
+        install()
+        write_key(target_path, key)
+        # copied under a temporary name and renamed so that a partial copy is never restored
+        temp_path = '%s.%d.tmp' % (cached_path, os.getpid())
+        if os.path.lexists(temp_path):
+            shutil.rmtree(temp_path)
+        os.makedirs(self.path, 0o755, exist_ok=True)
+        shutil.copytree(target_path, temp_path, symlinks=True)
+        with file_lock(lock_path):
+            if os.path.isdir(cached_path):
+                shutil.rmtree(cached_path)
+            os.rename(temp_path, cached_path)
+            self.prune(kind)
+        with self.lock:
+            self.misses.append((kind, get_size(target_path)))
+        print('  %s dependencies installed and cached' % kind)
+
+    def add_hit(self, kind, target_path, how):
+        size = get_size(target_path)
+        with self.lock:
+            self.hits.append((kind, size))
+        print('  %s dependencies unchanged, %s (%s)' % (kind, how, format_size(size)))
+
+    def prune(self, kind):
+        """
+        Removes all but the most recently used copies of a kind, the kind's lock must be held
+        """
+        prefix = '%s-' % kind
+        cached_paths = [
+            os.path.join(self.path, name)
+            for name in os.listdir(self.path)
+            if name.startswith(prefix) and not name.endswith(('.tmp', '.lock'))
+        ]
+        cached_paths.sort(key=os.path.getmtime, reverse=True)
+        for cached_path in cached_paths[self.keep:]:
+            shutil.rmtree(cached_path)
+
+    def print_summary(self):
+        if not self.hits and not self.misses:
+            return
+        cache_size = get_size(self.path) if os.path.isdir(self.path) else 0
+        print('Dependency cache: %d hit(s) (%s), %d miss(es) (%s), %s cached in total' % (
+            len(self.hits), format_size(sum(size for _, size in self.hits)),
+            len(self.misses), format_size(sum(size for _, size in self.misses)),
+            format_size(cache_size),
+        ))
+
+
+def read_key(target_path):
+    try:
+        with open(os.path.join(target_path, key_file_name)) as f:
+            return f.read().strip()
+    except (IOError, OSError):
+        return None
+
+
+def remove_key(target_path):
+    key_path = os.path.join(target_path, key_file_name)
+    if os.path.exists(key_path):
+        os.remove(key_path)
+
+
+def write_key(target_path, key):
+    os.makedirs(target_path, 0o755, exist_ok=True)
+    with open(os.path.join(target_path, key_file_name), 'w') as f:
+        f.write(key)
+
+
+def get_size(path):
+    size = 0
+    for dir_path, dir_names, file_names in os.walk(path):
+        for file_name in file_names:
+            size += os.lstat(os.path.join(dir_path, file_name)).st_size
+    return size
+
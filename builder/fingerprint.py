@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+import posixpath
+import re
+
+from builder.css import css_import_re, css_url_re
+from builder.sync import copy_file
+
+skipped_suffixes = ('.gz', '.br', '.map')
+
+
+def load_manifest(manifest_path):
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path) as f:
+        return json.load(f).get('paths', {})
+
+
+def fingerprint_folder(static_path, manifest_path, preload=()):
+    """
+    Writes a copy of every static file with a content hash in its name
+    and a manifest mapping original names to hashed ones.
+    Urls and @import strings in stylesheets are rewritten to point at hashed names.
+    :param static_path: root of the static files
+    :param manifest_path: path of the json manifest to write
+    :param preload: list of {'path': …, 'as': …} for assets pages should preload, also saved in the manifest
+    :return: the mapping of original to hashed relative paths
+    """
+    # remove outputs of a previous build so they are not fingerprinted again
+    for hashed_path in load_manifest(manifest_path).values():
+        for suffix in ('',) + skipped_suffixes:
+            path = os.path.join(static_path, hashed_path + suffix)
+            if os.path.exists(path):
+                os.remove(path)
+
+    paths = []
+    for dir_path, dir_names, file_names in os.walk(static_path):
+        dir_names.sort()
+        for file_name in sorted(file_names):
+            if file_name.endswith(skipped_suffixes) or file_name.startswith('.'):
+                continue
+            relative_path = os.path.relpath(os.path.join(dir_path, file_name), static_path)
+            paths.append(relative_path.replace(os.sep, '/'))
+
+    # stylesheets go last so that the files they refer to, including other stylesheets, are already hashed
+    stylesheet_paths = sort_stylesheets(static_path, [path for path in paths if path.endswith('.css')])
+    hashed_paths = {}
+    for path in [path for path in paths if not path.endswith('.css')] + stylesheet_paths:
+        full_path = os.path.join(static_path, path)
+        if path.endswith('.css'):
+            with open(full_path, 'rb') as f:
+                content = f.read().decode('utf-8')
+            content = rewrite_css_urls(path, content, hashed_paths).encode('utf-8')
+            hashed_path = get_hashed_path(path, content)
+            with open(os.path.join(static_path, hashed_path), 'wb') as f:
+                f.write(content)
+        else:
+            with open(full_path, 'rb') as f:
+                hashed_path = get_hashed_path(path, f.read())
+            copy_file(full_path, os.path.join(static_path, hashed_path))
+        hashed_paths[path] = hashed_path
+
+    with open(manifest_path, 'w') as f:
+        json.dump({'version': 1, 'paths': hashed_paths, 'preload': list(preload)}, f, indent=2, sort_keys=True)
+    return hashed_paths
+
+
+def get_hashed_path(path, content):
+    root, ext = posixpath.splitext(path)
+    return '%s.%s%s' % (root, hashlib.md5(content).hexdigest()[:12], ext)
+
+
+def find_css_references(css_path, content):
+    """
+    Returns the relative paths of files a stylesheet refers to with url() or @import
+    """
+    paths = []
+    for regex in (css_url_re, css_import_re):
+        for match in regex.finditer(content):
+            target = resolve_css_reference(css_path, match.group('url'))
+            if target:
+                paths.append(target[0])
+    return paths
+
+
+def sort_stylesheets(static_path, paths):
+    """
+    Orders stylesheets so that those referred to by another come before it
+    """
+    references = {}
+    for path in paths:
+        with open(os.path.join(static_path, path), 'rb') as f:
+            references[path] = find_css_references(path, f.read().decode('utf-8'))
+    sorted_paths = []
+    visited = set()
+
+    def visit(path):
+        if path in visited:
+            return
+        visited.add(path)
+        for referenced_path in references[path]:
+            if referenced_path in references:
+                visit(referenced_path)
+        sorted_paths.append(path)
+
+    for path in paths:
+        visit(path)
+    return sorted_paths
+
+
+def resolve_css_reference(css_path, url):
+    """
+    Returns the relative path a url in a stylesheet refers to along with any query string or fragment,
+    or None if it is not a relative url
+    """
+    if not url or url.startswith(('data:', '#', '/')) or '//' in url:
+        return None
+    url_path, suffix = re.match(r'^([^?#]*)(.*)$', url).groups()
+    return posixpath.normpath(posixpath.join(posixpath.dirname(css_path), url_path)), suffix
+
+
+def rewrite_css_urls(css_path, content, hashed_paths):
+    def get_hashed_url(url):
+        target = resolve_css_reference(css_path, url)
+        hashed_path = target and hashed_paths.get(target[0])
+        if not hashed_path:
+            return None
+        url_path, suffix = url[:len(url) - len(target[1])], target[1]
+        return posixpath.join(posixpath.dirname(url_path), posixpath.basename(hashed_path)) + suffix
+
+    def replace(template):
+        def replace_match(match):
+            hashed_url = get_hashed_url(match.group('url'))
+            if not hashed_url:
+                return match.group(0)
+            return template % {'quote': match.group('quote'), 'url': hashed_url}
+
+        return replace_match
+
+    content = css_url_re.sub(replace('url(%(quote)s%(url)s%(quote)s)'), content)
+    return css_import_re.sub(replace('@import %(quote)s%(url)s%(quote)s'), content)
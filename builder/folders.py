@@ -1,5 +1,6 @@
 import os
 import re
+import subprocess
 
 
 class FolderStructure:
@@ -15,11 +16,26 @@ class FolderStructure:
 class Repository(FolderStructure):
     git_url = ''
     version = None
+    # tag, branch or commit to check out, latest if None
+    ref = None
 
     def __init__(self, path):
         super().__init__(path)
         self.path = self._get_full_path(self.name)
 
+    def get_head_commit(self):
+        """
+        Returns the commit hash currently checked out
+        """
+        output = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=self.path)
+        return output.decode('utf-8').strip()
+
+    def get_build_output_paths(self):
+        """
+        Returns the paths that building the repository produces, None if any are missing
+        """
+        return []
+
 
 class DjangoAppPackage(FolderStructure):
     name = 'django_moj_template'
@@ -28,12 +44,20 @@ class DjangoAppPackage(FolderStructure):
         super().__init__(path)
         self.build_flag_path = self._get_full_path('.build-date')
         self.app_path = self._get_full_path(self.name)
+        self.manifest_path = self._get_full_path(self.name, 'static-manifest.json')
+        self.sizes_path = self._get_full_path('asset-sizes.json')
+        self.responsive_images_path = self._get_full_path(self.name, 'responsive-images.json')
         self.static_path = self._get_full_path(self.name, 'static')
         self.images_path = self._get_full_path(self.name, 'static', 'images')
         self.javascripts_path = self._get_full_path(self.name, 'static', 'javascripts')
         self.stylesheets_path = self._get_full_path(self.name, 'static', 'stylesheets')
         self.templates_path = self._get_full_path(self.name, 'templates')
+        self.locale_path = self._get_full_path(self.name, 'locale')
         self.assets_src_path = self._get_full_path(self.name, 'assets-src')
+        self.layout_template_paths = [
+            self._get_full_path(self.name, 'templates', 'govuk_template', 'base.html'),
+            self._get_full_path(self.name, 'templates', self.name, 'base.html'),
+        ]
 
 
 class GOVUKTemplate(Repository):
@@ -61,6 +85,8 @@ class GOVUKTemplate(Repository):
                 self.version = matches.group('version')
                 return True
 
+            if not os.path.isdir(self.pkg_root_path):
+                return None
             pkg_path = list(filter(matcher, os.listdir(self.pkg_root_path)))
             if len(pkg_path) != 1:
                 return None
@@ -82,6 +108,9 @@ class GOVUKTemplate(Repository):
 
         return self.app_path
 
+    def get_build_output_paths(self):
+        return [self.find_pkg_path() and self.find_app_path()]
+
 
 class GOVUKElements(Repository):
     name = 'govuk_elements'
@@ -92,3 +121,6 @@ class GOVUKElements(Repository):
         # these do not exist until gulp tasks run:
         self.content_path = self._get_full_path('govuk_modules', 'public')
         self.elements_sass_path = self._get_full_path('public', 'sass')
+
+    def get_build_output_paths(self):
+        return [self.content_path, self.elements_sass_path]
@@ -0,0 +1,207 @@
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import os
+import posixpath
+import re
+import shutil
+
+from builder import css
+
+try:
+    from fontTools import subset as font_subset
+except ImportError:
+    font_subset = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# latin text including punctuation, currency and typographic symbols
+base_unicode_ranges = [
+    (0x0000, 0x00FF), (0x0131, 0x0131), (0x0152, 0x0153), (0x02BB, 0x02BC), (0x02C6, 0x02C6), (0x02DA, 0x02DA),
+    (0x02DC, 0x02DC), (0x2000, 0x206F), (0x2074, 0x2074), (0x20AC, 0x20AC), (0x2122, 0x2122), (0x2191, 0x2191),
+    (0x2193, 0x2193), (0x2212, 0x2212), (0x2215, 0x2215), (0xFEFF, 0xFEFF), (0xFFFD, 0xFFFD),
+]
+# letters needed by each language beyond the base ranges
+language_unicode_ranges = {
+    # ŵ, ŷ, ÿ and grave, acute and diaeresis forms of w and y
+    'cy': [(0x0174, 0x0178), (0x1E80, 0x1E85), (0x1EF2, 0x1EF3)],
+}
+subsettable_extensions = ('.woff2', '.woff', '.ttf', '.otf')
+subset_suffix = '.subset.woff2'
+
+
+def is_available():
+    # writing woff2 needs brotli as well as fonttools
+    return font_subset is not None and brotli is not None
+
+
+def get_codepoints(languages, *catalog_paths):
+    """
+    Returns the characters that fonts need for the given languages
+    along with any used in the translation catalogs
+    :param languages: language codes, e.g. ['en', 'cy']
+    :param catalog_paths: folders containing .po files
+    """
+    codepoints = set()
+    for language in languages:
+        for start, end in base_unicode_ranges + language_unicode_ranges.get(language, []):
+            codepoints.update(range(start, end + 1))
+    for catalog_path in catalog_paths:
+        for dir_path, dir_names, file_names in os.walk(catalog_path):
+            for file_name in file_names:
+                if file_name.endswith('.po'):
+                    with open(os.path.join(dir_path, file_name), encoding='utf-8') as f:
+                        codepoints.update(ord(char) for char in f.read() if ord(char) >= 0x20)
+    return codepoints
+
+
+def format_unicode_range(codepoints):
+    """
+    Returns a css unicode-range value covering the codepoints
+    """
+    ranges = []
+    for codepoint in sorted(codepoints):
+        if ranges and ranges[-1][1] == codepoint - 1:
+            ranges[-1][1] = codepoint
+        else:
+            ranges.append([codepoint, codepoint])
+    return ', '.join(
+        'U+%04X' % start if start == end else 'U+%04X-%04X' % (start, end)
+        for start, end in ranges
+    )
+
+
+def subset_stylesheets(stylesheet_paths, codepoints, cache_path, max_workers=None):
+    """
+    Writes woff2 subsets of the fonts declared in stylesheets containing only the given characters
+    and rewrites their @font-face rules to use the subsets first, limited to the subsets' unicode-range.
+    Fonts only available in other formats, e.g. eot for old versions of internet explorer, are left as they are.
+    :param stylesheet_paths: stylesheets to rewrite
+    :param codepoints: characters to keep
+    :param cache_path: folder of subset fonts keyed by the hash of their original content and the characters kept
+    :param max_workers: number of subsetting processes, defaults to the number of CPUs
+    :return: list of (font path, original size, subset size, whether it came from the cache)
+    """
+    stylesheets = {}
+    font_paths = set()
+    for stylesheet_path in stylesheet_paths:
+        with open(stylesheet_path) as f:
+            content = f.read()
+        sources = find_subsettable_fonts(stylesheet_path, content)
+        if sources:
+            stylesheets[stylesheet_path] = content
+            font_paths.update(sources.values())
+    font_paths = sorted(font_paths)
+
+    os.makedirs(cache_path, 0o755, exist_ok=True)
+    codepoints = sorted(codepoints)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(subset_font, font_path, get_subset_path(font_path), codepoints, cache_path)
+            for font_path in font_paths
+        ]
+        results = [future.result() for future in futures]
+
+    unicode_range = format_unicode_range(codepoints)
+    for stylesheet_path, content in stylesheets.items():
+        with open(stylesheet_path, 'w') as f:
+            f.write(rewrite_font_faces(stylesheet_path, content, unicode_range))
+    return [(font_path,) + result for font_path, result in zip(font_paths, results)]
+
+
+def find_subsettable_fonts(stylesheet_path, content):
+    """
+    Returns a mapping of url to font path of the preferred source of each @font-face that can be subset
+    """
+    sources = {}
+    for url in css.find_font_urls(content) + find_other_font_urls(content):
+        if not url.endswith(subsettable_extensions):
+            continue
+        font_path = os.path.normpath(os.path.join(os.path.dirname(stylesheet_path), url))
+        if url.endswith(subset_suffix):
+            # already rewritten by a previous build, the subset is made again from the original font
+            font_root = font_path[:-len(subset_suffix)]
+            font_path = next((font_root + extension for extension in subsettable_extensions
+                              if os.path.exists(font_root + extension)), None)
+        if font_path and os.path.exists(font_path):
+            sources[url] = font_path
+    return sources
+
+
+def find_other_font_urls(content):
+    """
+    Returns the first truetype or opentype url of @font-face rules that have no woff sources
+    """
+    urls = []
+    for font_face in css.font_face_re.finditer(content):
+        font_urls = css.find_urls(font_face.group('body'))
+        if not any(url.endswith(('.woff', '.woff2')) for url in font_urls):
+            urls.extend([url for url in font_urls if url.endswith(('.ttf', '.otf'))][:1])
+    return urls
+
+
+def get_subset_path(font_path):
+    return os.path.splitext(font_path)[0] + subset_suffix
+
+
+def rewrite_font_faces(stylesheet_path, content, unicode_range):
+    sources = find_subsettable_fonts(stylesheet_path, content)
+
+    def replace_font_face(font_face):
+        body = font_face.group('body')
+        src_matches = list(css.font_src_re.finditer(body))
+        if not src_matches:
+            return font_face.group(0)
+        src_match = src_matches[-1]
+        font_sources = css.split_font_sources(src_match.group('value'))
+        source_urls = [css.find_urls(source)[:1] for source in font_sources]
+        subset_url = None
+        for urls in source_urls:
+            if urls and urls[0] in sources:
+                subset_url = urls[0] if urls[0].endswith(subset_suffix) else \
+                    posixpath.splitext(urls[0])[0] + subset_suffix
+                break
+        if not subset_url:
+            return font_face.group(0)
+        # the full woff2 is no longer used as browsers supporting it pick the subset
+        font_sources = [
+            source for source, urls in zip(font_sources, source_urls)
+            if not urls or not urls[0].endswith('.woff2')
+        ]
+        font_sources.insert(0, 'url(%s) format("woff2")' % subset_url)
+        body = '%s%s%s%s' % (body[:src_match.start()], src_match.group('prefix'), ', '.join(font_sources),
+                             body[src_match.end():])
+        body = re.sub(r'(^|;)\s*unicode-range\s*:[^;]*', r'\1', body, flags=re.I)
+        body = re.sub(r'[\s;]*$', '', body)
+        return '@font-face {%s;\n  unicode-range: %s;\n}' % (body, unicode_range)
+
+    return css.font_face_re.sub(replace_font_face, content)
+
+
+def subset_font(path, target_path, codepoints, cache_path):
+    """
+    Writes a woff2 subset of a font, reusing a cached one made with the same characters
+    :return: (original size, subset size, whether it came from the cache)
+    """
+    with open(path, 'rb') as f:
+        content = f.read()
+    digest = hashlib.sha1(content)
+    digest.update(','.join(map(str, codepoints)).encode('ascii'))
+    cached_path = os.path.join(cache_path, digest.hexdigest() + subset_suffix)
+    from_cache = os.path.exists(cached_path)
+    if not from_cache:
+        options = font_subset.Options()
+        options.flavor = 'woff2'
+        options.layout_features = ['*']
+        options.name_IDs = ['*']
+        options.notdef_outline = True
+        font = font_subset.load_font(path, options)
+        subsetter = font_subset.Subsetter(options)
+        subsetter.populate(unicodes=codepoints)
+        subsetter.subset(font)
+        temp_path = '%s.%d.tmp' % (cached_path, os.getpid())
+        font_subset.save_font(font, temp_path, options)
+        os.rename(temp_path, cached_path)
+    shutil.copyfile(cached_path, target_path)
+    return len(content), os.path.getsize(target_path), from_cache
@@ -0,0 +1,239 @@
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import io
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+
+try:
+    from PIL import Image, features as image_features
+except ImportError:
+    Image = None
+
+optimisers = {
+    '.png': [['optipng', '-quiet', '-o2', '-strip', 'all', '-out', '{target}', '{src}']],
+    '.jpg': [['jpegtran', '-copy', 'none', '-optimize', '-progressive', '-outfile', '{target}', '{src}']],
+    '.gif': [['gifsicle', '--optimize=3', '--output', '{target}', '{src}']],
+}
+optimisers['.jpeg'] = optimisers['.jpg']
+sibling_formats = {
+    'webp': ['cwebp', '-quiet', '-lossless', '{src}', '-o', '{target}'],
+    'avif': ['avifenc', '--lossless', '{src}', '{target}'],
+}
+
+# resized variants are written for these, in their own format and any available modern ones
+resizable_formats = {'.png': 'PNG', '.jpg': 'JPEG', '.jpeg': 'JPEG'}
+modern_formats = [('avif', 'AVIF', 'image/avif'), ('webp', 'WEBP', 'image/webp')]
+content_types = {'.png': 'image/png', '.jpg': 'image/jpeg', '.jpeg': 'image/jpeg'}
+variant_re = re.compile(r'\.\d+w\.\w+$')
+
+
+def get_available_tools():
+    tools = [commands[0][0] for commands in optimisers.values()]
+    tools.extend(command[0] for command in sibling_formats.values())
+    return {tool for tool in tools if shutil.which(tool)}
+
+
+def find_images(*paths):
+    image_paths = []
+    for root_path in paths:
+        for dir_path, dir_names, file_names in os.walk(root_path):
+            for file_name in sorted(file_names):
+                if os.path.splitext(file_name)[1].lower() in optimisers:
+                    image_paths.append(os.path.join(dir_path, file_name))
+    return image_paths
+
+
+def optimise_images(image_paths, cache_path, formats=(), max_workers=None):
+    """
+    Losslessly recompresses images in place using whichever of optipng, jpegtran and gifsicle are installed,
+    optionally writing modern format siblings, e.g. logo.png.webp
+    :param image_paths: images to optimise
+    :param cache_path: folder of optimised images keyed by the hash of their original content
+    :param formats: sibling formats to write, see sibling_formats
+    :param max_workers: number of optimising processes, defaults to the number of CPUs
+    :return: list of (path, original size, optimised size, whether it came from the cache)
+    """
+    tools = get_available_tools()
+    os.makedirs(cache_path, 0o755, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(optimise_image, image_path, cache_path, tools, formats)
+            for image_path in image_paths
+        ]
+        return [future.result() for future in futures]
+
+
+def optimise_image(path, cache_path, tools, formats=()):
+    with open(path, 'rb') as f:
+        content = f.read()
+    content_hash = hashlib.sha1(content).hexdigest()
+    ext = os.path.splitext(path)[1].lower()
+    cached_path = os.path.join(cache_path, content_hash + ext)
+
+    from_cache = os.path.exists(cached_path)
+    if from_cache:
+        with open(cached_path, 'rb') as f:
+            optimised_content = f.read()
+    else:
+        optimised_content = content
+        commands = [command for command in optimisers[ext] if command[0] in tools]
+        for command in commands:
+            optimised_content = run_tool(command, optimised_content, ext) or optimised_content
+        if commands:
+            write_file(cached_path, optimised_content)
+            # already optimised images are recognised too
+            write_file(os.path.join(cache_path, hashlib.sha1(optimised_content).hexdigest() + ext),
+                       optimised_content)
+
+    if optimised_content != content:
+        write_file(path, optimised_content)
+
+    for image_format in formats:
+        command = sibling_formats[image_format]
+        if command[0] not in tools:
+            continue
+        sibling_ext = '.' + image_format
+        cached_sibling_path = os.path.join(cache_path, content_hash + ext + sibling_ext)
+        if not os.path.exists(cached_sibling_path):
+            sibling_content = run_tool(command, optimised_content, ext, sibling_ext, keep_larger=True)
+            if not sibling_content:
+                continue
+            write_file(cached_sibling_path, sibling_content)
+        shutil.copyfile(cached_sibling_path, path + sibling_ext)
+
+    return path, len(content), len(optimised_content), from_cache
+
+
+def run_tool(command, content, ext, target_ext=None, keep_larger=False):
+    """
+    Runs an image tool on content returning its output, or None if it failed or did not improve on the input
+    """
+    with tempfile.TemporaryDirectory() as tmp_path:
+        src_path = os.path.join(tmp_path, 'src' + ext)
+        target_path = os.path.join(tmp_path, 'target' + (target_ext or ext))
+        write_file(src_path, content)
+        command = [part.format(src=src_path, target=target_path) for part in command]
+        try:
+            subprocess.check_call(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except (OSError, subprocess.CalledProcessError):
+            return None
+        if not os.path.exists(target_path):
+            return None
+        with open(target_path, 'rb') as f:
+            output = f.read()
+    if not output or (not keep_larger and len(output) >= len(content)):
+        return None
+    return output
+
+
+def write_file(path, content):
+    with open(path, 'wb') as f:
+        f.write(content)
+
+
+def get_modern_formats():
+    """
+    Returns the modern formats Pillow can write, best first
+    """
+    if Image is None:
+        return []
+    return [image_format for image_format in modern_formats if image_features.check(image_format[0])]
+
+
+def find_resizable_images(root_path):
+    image_paths = []
+    for dir_path, dir_names, file_names in os.walk(root_path):
+        for file_name in sorted(file_names):
+            if os.path.splitext(file_name)[1].lower() in resizable_formats and not variant_re.search(file_name):
+                image_paths.append(os.path.join(dir_path, file_name))
+    return image_paths
+
+
+def get_variant_widths(width, widths, densities):
+    """
+    Returns the pixel widths to resize an image to for the given layout widths at each pixel density,
+    only those smaller than the image itself
+    """
+    return sorted({int(layout_width * density) for layout_width in widths for density in densities
+                   if int(layout_width * density) < width})
+
+
+def make_responsive_images(image_paths, cache_path, widths, densities, max_workers=None):
+    """
+    Writes resized variants of images, e.g. logo.png.640w.png, and modern format versions of each size
+    including the original one, e.g. logo.png.640w.webp and logo.png.1280w.webp, using Pillow.
+    Variants keep the source's extension so that those of e.g. logo.png and logo.jpg are distinct
+    :param image_paths: images to resize
+    :param cache_path: folder of variants keyed by the hash of their original content, width and format
+    :param widths: layout widths in css pixels
+    :param densities: device pixel ratios
+    :param max_workers: number of resizing processes, defaults to the number of CPUs
+    :return: list of (path, width, height, [(variant path, width, content type, size)])
+    """
+    os.makedirs(cache_path, 0o755, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(make_responsive_image, image_path, cache_path, widths, densities)
+            for image_path in image_paths
+        ]
+        return [future.result() for future in futures]
+
+
+def make_responsive_image(path, cache_path, widths, densities):
+    with open(path, 'rb') as f:
+        content = f.read()
+    content_hash = hashlib.sha1(content).hexdigest()
+    ext = os.path.splitext(path)[1]
+    remove_variants(path)
+    image = Image.open(io.BytesIO(content))
+    width, height = image.size
+    formats = [(ext, resizable_formats[ext.lower()], content_types[ext.lower()])]
+    formats.extend(('.' + name, pil_format, content_type) for name, pil_format, content_type in get_modern_formats())
+
+    variants = []
+    for variant_width in get_variant_widths(width, widths, densities) + [width]:
+        for variant_ext, pil_format, content_type in formats:
+            if variant_width == width and variant_ext == ext:
+                # the original is the largest variant
+                variants.append((path, width, content_type, len(content)))
+                continue
+            variant_path = '%s.%dw%s' % (path, variant_width, variant_ext)
+            cached_path = os.path.join(cache_path, '%s.%dw%s' % (content_hash, variant_width, variant_ext))
+            if not os.path.exists(cached_path):
+                variant_height = max(int(round(height * variant_width / width)), 1)
+                write_file(cached_path, resize_image(image, variant_width, variant_height, pil_format))
+            shutil.copyfile(cached_path, variant_path)
+            variants.append((variant_path, variant_width, content_type, os.path.getsize(variant_path)))
+    return path, width, height, variants
+
+
+def remove_variants(path):
+    """
+    Removes the variants of an image written by a previous build, which may have used other widths
+    """
+    dir_path, file_name = os.path.split(path)
+    variant_name_re = re.compile(r'^%s\.\d+w\.\w+$' % re.escape(file_name))
+    for name in os.listdir(dir_path):
+        if variant_name_re.match(name):
+            os.remove(os.path.join(dir_path, name))
+
+
+def resize_image(image, width, height, pil_format):
+    if image.mode in ('1', 'P'):
+        # palette images would otherwise be resized without resampling
+        image = image.convert('RGBA')
+    if (width, height) != image.size:
+        image = image.resize((width, height), Image.LANCZOS)
+    if pil_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    output = io.BytesIO()
+    if pil_format == 'JPEG':
+        image.save(output, pil_format, quality=85, optimize=True, progressive=True)
+    elif pil_format == 'PNG':
+        image.save(output, pil_format, optimize=True)
+    else:
+        image.save(output, pil_format, quality=80)
+    return output.getvalue()
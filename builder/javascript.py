@@ -0,0 +1,100 @@
+from collections import OrderedDict
+import glob
+import json
+import os
+import re
+import shutil
+import subprocess
+
+from builder.utils import check_call
+
+# scripts are concatenated in the order their patterns are listed, relative to the javascripts folder
+bundles = OrderedDict([
+    # loaded by every page using the base layout
+    ('govuk-template', ['govuk-template.js']),
+    # optional, for services that also load jquery
+    ('govuk-toolkit', ['vendor/polyfills/bind.js', 'govuk/modules.js', 'govuk/modules/*.js', 'govuk/*.js']),
+])
+bundle_suffix = '.bundle.js'
+source_map_comment_re = re.compile(r'^\s*//[#@] sourceMappingURL=.*$', re.M)
+
+
+def get_uglifyjs():
+    """
+    Returns the path of uglifyjs if version 3 is installed
+    """
+    uglifyjs = shutil.which('uglifyjs')
+    if not uglifyjs:
+        return None
+    try:
+        version = subprocess.check_output([uglifyjs, '--version']).decode('utf-8')
+    except subprocess.CalledProcessError:
+        return None
+    return uglifyjs if re.match(r'uglify-js 3\.', version) else None
+
+
+def find_bundle_sources(root_path, patterns):
+    """
+    Returns the relative paths of existing scripts matching the patterns, in order and without duplicates
+    """
+    source_paths = []
+    for pattern in patterns:
+        for path in sorted(glob.glob(os.path.join(root_path, pattern))):
+            path = os.path.relpath(path, root_path).replace(os.sep, '/')
+            if path not in source_paths and not path.endswith(bundle_suffix):
+                source_paths.append(path)
+    return source_paths
+
+
+def bundle_scripts(root_path, name, source_paths, uglifyjs=None):
+    """
+    Writes a bundle of scripts with a source map referring to the originals,
+    minified if uglifyjs is available and otherwise only concatenated
+    :param root_path: the javascripts folder
+    :param name: name of the bundle, written to <name>.bundle.js
+    :param source_paths: scripts to include relative to root_path
+    :param uglifyjs: path of uglifyjs, see get_uglifyjs
+    :return: relative path of the bundle
+    """
+    bundle_path = name + bundle_suffix
+    map_path = bundle_path + '.map'
+    if uglifyjs:
+        check_call([uglifyjs] + source_paths + [
+            '--compress', '--mangle',
+            '--output', bundle_path,
+            '--source-map', "url='%s'" % map_path,
+        ], cwd=root_path)
+    else:
+        concatenate_scripts(root_path, source_paths, bundle_path, map_path)
+    return bundle_path
+
+
+def concatenate_scripts(root_path, source_paths, bundle_path, map_path):
+    """
+    Joins scripts into one file with an index source map mapping each line back to its original
+    """
+    output = []
+    sections = []
+    line = 0
+    for source_path in source_paths:
+        with open(os.path.join(root_path, source_path)) as f:
+            content = source_map_comment_re.sub('', f.read()).rstrip('\n')
+        line_count = content.count('\n') + 1
+        sections.append({
+            'offset': {'line': line, 'column': 0},
+            'map': {
+                'version': 3,
+                'sources': [source_path],
+                'names': [],
+                # first column of every line maps to the same line of the source
+                'mappings': ';'.join(['AAAA'] + ['AACA'] * (line_count - 1)),
+            },
+        })
+        # a separating semicolon stops statements running into the next script
+        output.append(content + '\n;\n')
+        line += line_count + 1
+    output.append('//# sourceMappingURL=%s\n' % map_path)
+    with open(os.path.join(root_path, bundle_path), 'w') as f:
+        f.write(''.join(output))
+    with open(os.path.join(root_path, map_path), 'w') as f:
+        json.dump({'version': 3, 'file': bundle_path, 'sections': sections}, f)
@@ -0,0 +1,133 @@
+import hashlib
+import json
+import os
+import posixpath
+import re
+
+from builder.cache import BuildCache
+
+sass_extensions = ('.scss', '.sass')
+comment_re = re.compile(r'/\*.*?\*/|(?:^|(?<=\s))//[^\n]*', re.S)
+import_re = re.compile(r'@import\s+((?:[^;\n]|,\s*\n)+)')
+import_name_re = re.compile(r'''(["'])(.*?)\1''')
+
+
+class SassGraph:
+    """
+    Persistent record of the content hash and @imports of every sass file under a folder,
+    used to find which entry points are affected by changes to partials
+    """
+
+    def __init__(self, path, root_path):
+        """
+        :param path: json file the graph is saved to
+        :param root_path: folder of sass sources, also the load path
+        """
+        self.path = path
+        self.root_path = root_path
+        self.files = {}
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self.files = json.load(f).get('files', {})
+            except ValueError:
+                self.files = {}
+
+    def update(self):
+        """
+        Hashes all sass files, parsing imports only of those that changed since the graph was saved
+        """
+        files = {}
+        for dir_path, dir_names, file_names in os.walk(self.root_path):
+            dir_names[:] = sorted(name for name in dir_names if not name.startswith('.'))
+            for file_name in sorted(file_names):
+                if not file_name.endswith(sass_extensions):
+                    continue
+                full_path = os.path.join(dir_path, file_name)
+                path = os.path.relpath(full_path, self.root_path).replace(os.sep, '/')
+                with open(full_path, 'rb') as f:
+                    content = f.read()
+                content_hash = hashlib.sha1(content).hexdigest()
+                previous = self.files.get(path)
+                if previous and previous['hash'] == content_hash:
+                    files[path] = previous
+                else:
+                    files[path] = {'hash': content_hash, 'imports': parse_imports(content.decode('utf-8'))}
+        self.files = files
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), 0o755, exist_ok=True)
+        with open(self.path, 'w') as f:
+            json.dump({'version': 1, 'files': self.files}, f, indent=2, sort_keys=True)
+
+    def get_entry_points(self):
+        """
+        Returns the paths of files that are not partials, these are compiled into stylesheets
+        """
+        return sorted(path for path in self.files if not posixpath.basename(path).startswith('_'))
+
+    def resolve(self, importer, name):
+        """
+        Returns the path of the file an import refers to, or None if it is not a sass file within the folder
+        """
+        if name.endswith('.css') or name.startswith(('http://', 'https://', '//', 'url(')):
+            return None
+        import_dir, import_base = posixpath.split(name)
+        if import_base.endswith(sass_extensions):
+            candidates = [import_base, '_' + import_base]
+        else:
+            candidates = [prefix + import_base + extension
+                          for extension in sass_extensions for prefix in ('', '_')]
+        # relative to the importing file first, then the load path
+        for base_dir in (posixpath.dirname(importer), ''):
+            for candidate in candidates:
+                path = posixpath.normpath(posixpath.join(base_dir, import_dir, candidate))
+                if path in self.files:
+                    return path
+        return None
+
+    def get_dependencies(self, entry_point):
+        """
+        Returns the entry point and every file it imports, directly or indirectly
+        """
+        dependencies = set()
+        pending = [entry_point]
+        while pending:
+            path = pending.pop()
+            if path in dependencies:
+                continue
+            dependencies.add(path)
+            for name in self.files[path]['imports']:
+                imported_path = self.resolve(path, name)
+                if imported_path:
+                    pending.append(imported_path)
+        return dependencies
+
+    def get_key(self, entry_point):
+        """
+        Returns a digest of the contents of all the files an entry point is compiled from
+        """
+        parts = []
+        for path in sorted(self.get_dependencies(entry_point)):
+            parts.extend([path, self.files[path]['hash']])
+        return BuildCache.key(*parts)
+
+
+def parse_imports(content):
+    """
+    Returns the names of files imported by sass source, including plain css imports
+    """
+    names = []
+    for match in import_re.finditer(comment_re.sub('', content)):
+        statement = match.group(1)
+        quoted_names = [name_match.group(2) for name_match in import_name_re.finditer(statement)]
+        if quoted_names:
+            names.extend(quoted_names)
+        else:
+            # indented syntax allows unquoted names
+            names.extend(name.strip() for name in statement.split(',') if name.strip())
+    return names
+
+
+def get_output_name(entry_point):
+    return posixpath.splitext(entry_point)[0] + '.css'
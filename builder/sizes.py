@@ -0,0 +1,143 @@
+import fnmatch
+import json
+import os
+import re
+
+from builder.compress import get_encodings
+from builder.fingerprint import load_manifest, skipped_suffixes
+
+# size columns and the suffix of the precompressed variant each is read from
+compressions = [('raw', ''), ('gzip', '.gz'), ('brotli', '.br')]
+size_re = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*(bytes|b|kb|mb)?\s*$', re.I)
+size_units = {'bytes': 1, 'b': 1, 'kb': 1024, 'mb': 1024 * 1024}
+
+
+def measure_assets(static_path, manifest_path):
+    """
+    Returns the raw and precompressed sizes of every static file, keyed on its original name.
+    Sizes are those of the content-hashed copy that is served, falling back to the raw size
+    for files that are not worth compressing, brotli is None if it is not available.
+    :param static_path: root of the static files
+    :param manifest_path: fingerprinting manifest of original to hashed names
+    """
+    hashed_paths = load_manifest(manifest_path)
+    hashed_names = set(hashed_paths.values())
+    encoding_suffixes = {suffix for suffix, _ in get_encodings()}
+    sizes = {}
+    for dir_path, dir_names, file_names in os.walk(static_path):
+        for file_name in file_names:
+            if file_name.endswith(skipped_suffixes) or file_name.startswith('.'):
+                continue
+            path = os.path.relpath(os.path.join(dir_path, file_name), static_path).replace(os.sep, '/')
+            if path in hashed_names:
+                continue
+            full_path = os.path.join(static_path, hashed_paths.get(path, path))
+            raw_size = os.path.getsize(full_path)
+            asset_sizes = {}
+            for name, suffix in compressions:
+                if not suffix:
+                    asset_sizes[name] = raw_size
+                elif suffix not in encoding_suffixes:
+                    asset_sizes[name] = None
+                elif os.path.exists(full_path + suffix):
+                    asset_sizes[name] = os.path.getsize(full_path + suffix)
+                else:
+                    asset_sizes[name] = raw_size
+            sizes[path] = asset_sizes
+    return sizes
+
+
+def load_sizes(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f).get('assets', {})
+
+
+def save_sizes(path, sizes):
+    os.makedirs(os.path.dirname(path), 0o755, exist_ok=True)
+    totals = {
+        name: sum(asset_sizes[name] for asset_sizes in sizes.values()) if all(
+            asset_sizes[name] is not None for asset_sizes in sizes.values()
+        ) else None
+        for name, _ in compressions
+    }
+    with open(path, 'w') as f:
+        json.dump({'version': 1, 'assets': sizes, 'totals': totals}, f, indent=2, sort_keys=True)
+
+
+def get_size_changes(sizes, previous_sizes, compression='gzip'):
+    """
+    Returns (path, previous size, size) of assets that were added, removed or changed size,
+    largest growth first; sizes of added or removed assets are None
+    """
+    changes = []
+    for path in set(sizes) | set(previous_sizes):
+        size = sizes[path][compression] if path in sizes else None
+        previous_size = previous_sizes[path][compression] if path in previous_sizes else None
+        if size != previous_size:
+            changes.append((path, previous_size, size))
+    changes.sort(key=lambda change: ((change[2] or 0) - (change[1] or 0), change[0]), reverse=True)
+    return changes
+
+
+def parse_size(size):
+    """
+    Returns a number of bytes given as a number or a string like '30KB'
+    """
+    if isinstance(size, (int, float)):
+        return int(size)
+    match = size_re.match(size)
+    if not match:
+        raise ValueError('Cannot parse size %r' % size)
+    number, unit = match.groups()
+    return int(float(number) * size_units[(unit or 'bytes').lower()])
+
+
+def check_compression(compression):
+    """
+    Raises ValueError if sizes cannot be measured with a compression, being unknown or not installed
+    """
+    if compression not in dict(compressions):
+        raise ValueError('Unknown compression %r for budgets, use one of %s' % (
+            compression, ', '.join(name for name, _ in compressions),
+        ))
+    suffix = dict(compressions)[compression]
+    if suffix and suffix not in {suffix for suffix, _ in get_encodings()}:
+        raise ValueError('%s sizes cannot be measured for budgets as it is not installed' % compression)
+
+
+def load_budgets(path):
+    """
+    Reads a json file of size budgets, e.g.
+    {"compression": "gzip", "assets": {"stylesheets/main.css": "30KB"}, "totals": {"images/*": "200KB", "*": "1MB"}}
+    each asset matching an "assets" pattern must be within its budget whereas
+    the sum of all assets matching a "totals" pattern must be within that budget
+    """
+    with open(path) as f:
+        budgets = json.load(f)
+    check_compression(budgets.get('compression', 'gzip'))
+    return {
+        'compression': budgets.get('compression', 'gzip'),
+        'assets': {pattern: parse_size(size) for pattern, size in budgets.get('assets', {}).items()},
+        'totals': {pattern: parse_size(size) for pattern, size in budgets.get('totals', {}).items()},
+    }
+
+
+def check_budgets(sizes, budgets):
+    """
+    Returns (description, size, budget) of every budget that is exceeded
+    """
+    compression = budgets['compression']
+    check_compression(compression)
+    exceeded = []
+    for pattern, budget in sorted(budgets['assets'].items()):
+        for path in sorted(fnmatch.filter(sizes, pattern)):
+            size = sizes[path][compression]
+            if size > budget:
+                exceeded.append((path, size, budget))
+    for pattern, budget in sorted(budgets['totals'].items()):
+        size = sum(sizes[path][compression] for path in fnmatch.filter(sizes, pattern))
+        if size > budget:
+            exceeded.append(('total of %s' % pattern, size, budget))
+    return exceeded
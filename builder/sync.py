@@ -0,0 +1,106 @@
+import errno
+import hashlib
+import os
+import shutil
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# linux ioctl for copy-on-write cloning of a whole file (btrfs, xfs, etc.)
+FICLONE = 0x40049409
+
+
+def sync_folders(src_root_path, target_root_path):
+    """
+    Copies new and changed files from one folder tree into another in a single walk,
+    files are compared by size and modification time and only hashed when those disagree
+    :param src_root_path: folder to copy from
+    :param target_root_path: folder to copy into, created if necessary
+    :return: list of (relative path, 'new' or 'modified') for every file copied
+    """
+    changes = []
+    _sync_folder(src_root_path, target_root_path, '', changes)
+    return changes
+
+
+def _sync_folder(src_path, target_path, relative_path, changes):
+    try:
+        target_index = {entry.name: entry for entry in os.scandir(target_path)}
+    except FileNotFoundError:
+        os.makedirs(target_path, 0o755)
+        target_index = {}
+
+    for entry in os.scandir(src_path):
+        entry_relative_path = os.path.join(relative_path, entry.name)
+        target_entry = target_index.get(entry.name)
+        target_file_path = os.path.join(target_path, entry.name)
+        is_dir = entry.is_dir()
+        if target_entry is not None and is_dir != target_entry.is_dir(follow_symlinks=False):
+            # a file replaced by a folder or vice versa, e.g. after an upstream rename
+            if is_dir:
+                os.unlink(target_file_path)
+            else:
+                shutil.rmtree(target_file_path)
+            target_entry = None
+        if is_dir:
+            _sync_folder(entry.path, target_file_path, entry_relative_path, changes)
+            continue
+
+        src_stat = entry.stat()
+        if target_entry is None:
+            changes.append((entry_relative_path, 'new'))
+        else:
+            target_stat = target_entry.stat()
+            if src_stat.st_size == target_stat.st_size:
+                if src_stat.st_mtime_ns == target_stat.st_mtime_ns:
+                    continue
+                if hash_file(entry.path) == hash_file(target_file_path):
+                    # same content, record the source time so the next sync skips hashing
+                    os.utime(target_file_path, ns=(src_stat.st_atime_ns, src_stat.st_mtime_ns))
+                    continue
+            changes.append((entry_relative_path, 'modified'))
+
+        copy_file(entry.path, target_file_path)
+        os.utime(target_file_path, ns=(src_stat.st_atime_ns, src_stat.st_mtime_ns))
+
+
+def hash_file(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(65536), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def copy_file(src_path, target_path):
+    """
+    Copies file contents, cloning or copying within the kernel where the OS allows
+    """
+    with open(src_path, 'rb') as src, open(target_path, 'wb') as target:
+        if fcntl is not None:
+            try:
+                fcntl.ioctl(target.fileno(), FICLONE, src.fileno())
+                return
+            except OSError:
+                pass
+        copy_file_range = getattr(os, 'copy_file_range', None)
+        if copy_file_range is not None:
+            try:
+                size = os.fstat(src.fileno()).st_size
+                copied = 0
+                while copied < size:
+                    count = copy_file_range(src.fileno(), target.fileno(), size - copied)
+                    if not count:
+                        break
+                    copied += count
+                if copied == size:
+                    return
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+                    raise
+            src.seek(0)
+            target.seek(0)
+            target.truncate()
+        shutil.copyfileobj(src, target, 1024 * 1024)
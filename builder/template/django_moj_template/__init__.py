@@ -1,3 +1,4 @@
+__version__ = '0.1'
 default_app_config = 'django_moj_template.app.AppConfig'
 
 
@@ -8,3 +9,17 @@ def get_assets_src_path():
     from os import path
 
     return path.abspath(path.join(path.dirname(path.join(__file__)), 'assets-src'))
+
+
+def cached_template_loaders(debug=False):
+    """
+    Returns the recommended template loaders setting which caches compiled templates
+    unless debugging, use with APP_DIRS set to False
+    """
+    loaders = [
+        'django.template.loaders.filesystem.Loader',
+        'django.template.loaders.app_directories.Loader',
+    ]
+    if debug:
+        return loaders
+    return [('django.template.loaders.cached.Loader', loaders)]
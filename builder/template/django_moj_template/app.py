@@ -1,6 +1,15 @@
 from django.apps import AppConfig as DjangoAppConfig
+from django.conf import settings
 
 
 class AppConfig(DjangoAppConfig):
     name = 'django_moj_template'
     verbose_name = 'MoJ Template'
+
+    def ready(self):
+        # MOJ_TEMPLATE_WARM_UP = True compiles packaged templates at start-up, 'all' includes the project's own
+        warm_up = getattr(settings, 'MOJ_TEMPLATE_WARM_UP', False)
+        if warm_up:
+            from django_moj_template.loaders import warm_up_templates
+
+            warm_up_templates(include_project=warm_up == 'all')
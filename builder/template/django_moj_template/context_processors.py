@@ -1,12 +1,64 @@
-from django.utils.translation import get_language, ugettext as _
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.functional import lazy
+from django.utils.translation import get_language, ugettext as _, ugettext_lazy
 
+try:
+    from types import MappingProxyType
+except ImportError:
+    MappingProxyType = dict
 
-def moj_context(request):
+# one read-only context per active language, built on first use
+_contexts = {}
+
+
+def _build_context(html_lang, gettext):
     return {
-        'html_lang': get_language(),
+        'html_lang': html_lang,
         'homepage_url': 'https://www.gov.uk/',
-        'logo_link_title': _('Go to the GOV.UK homepage'),
-        'global_header_text': _('GOV.UK'),
-        'skip_link_message': _('Skip to main content'),
-        'crown_copyright_message': _('© Crown copyright')
+        'logo_link_title': gettext('Go to the GOV.UK homepage'),
+        'global_header_text': gettext('GOV.UK'),
+        'skip_link_message': gettext('Skip to main content'),
+        'crown_copyright_message': gettext('© Crown copyright')
     }
+
+
+def moj_context(request):
+    language = get_language()
+    try:
+        return _contexts[language]
+    except KeyError:
+        context = _contexts[language] = MappingProxyType(_build_context(language, _))
+        return context
+
+
+_lazy_context = MappingProxyType(_build_context(lazy(get_language, str)(), ugettext_lazy))
+
+
+def moj_lazy_context(request):
+    """
+    Same as moj_context but values are only translated when a template uses them
+    """
+    return _lazy_context
+
+
+def clear_contexts(**kwargs):
+    _contexts.clear()
+
+
+@receiver(setting_changed)
+def setting_changed_handler(setting, **kwargs):
+    if setting in ('LANGUAGES', 'LANGUAGE_CODE', 'LOCALE_PATHS', 'INSTALLED_APPS'):
+        clear_contexts()
+
+
+try:
+    # django 2.2+ reloads translations without restarting when catalogs change
+    from django.utils.autoreload import file_changed
+except ImportError:
+    pass
+else:
+    @receiver(file_changed)
+    def translation_file_changed(file_path, **kwargs):
+        if str(file_path).endswith('.mo'):
+            clear_contexts()
@@ -0,0 +1,136 @@
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import threading
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.functional import Promise
+from django.utils.translation import get_language
+
+from django_moj_template import __version__
+from django_moj_template.static import app_path, manifest_path
+
+# str and unicode on python 2
+text_types = (str, type(u''))
+
+
+class LRUCache(object):
+    """
+    A bounded in-process cache evicting the least recently used entries
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                value = self.entries.pop(key)
+            except KeyError:
+                return default
+            self.entries[key] = value
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = value
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+_cache = None
+_build_digest = None
+
+
+def get_fragment_cache():
+    """
+    Returns the cache for rendered fragments of the base layout according to MOJ_TEMPLATE_FRAGMENT_CACHE:
+    None (the default) for a local LRU cache bounded by MOJ_TEMPLATE_FRAGMENT_CACHE_SIZE entries,
+    the alias of a configured Django cache, or False to disable fragment caching
+    """
+    global _cache
+    if _cache is None:
+        alias = getattr(settings, 'MOJ_TEMPLATE_FRAGMENT_CACHE', None)
+        if alias is False:
+            _cache = False
+        elif alias:
+            from django.core.cache import caches
+
+            _cache = caches[alias]
+        else:
+            _cache = LRUCache(getattr(settings, 'MOJ_TEMPLATE_FRAGMENT_CACHE_SIZE', 256))
+    return _cache or None
+
+
+@receiver(setting_changed)
+def setting_changed_handler(setting, **kwargs):
+    global _cache
+    if setting.startswith('MOJ_TEMPLATE_FRAGMENT_CACHE'):
+        _cache = None
+
+
+def get_build_digest():
+    """
+    Returns a digest of the packaged static file manifest and templates, which change with every build
+    unlike the package version, so that a shared cache does not serve fragments of a previous build
+    """
+    global _build_digest
+    if _build_digest is None:
+        digest = hashlib.md5()
+        paths = [manifest_path]
+        for dir_path, dir_names, file_names in os.walk(os.path.join(app_path, 'templates')):
+            dir_names.sort()
+            paths.extend(os.path.join(dir_path, file_name) for file_name in sorted(file_names))
+        for path in paths:
+            try:
+                with open(path, 'rb') as f:
+                    digest.update(f.read())
+            except IOError:
+                pass
+            digest.update(b'\0')
+        _build_digest = digest.hexdigest()
+    return _build_digest
+
+
+def make_fragment_key(name, vary_on):
+    """
+    Returns a cache key for a fragment built from the active language, package version and build
+    and the values the fragment depends on, or None if a value cannot be serialised unambiguously
+    in which case the fragment should not be cached
+    """
+    digest = hashlib.md5()
+    for value in [__version__, get_build_digest(), get_language()] + list(vary_on):
+        try:
+            digest.update(_serialise(value).encode('utf-8'))
+        except TypeError:
+            return None
+        digest.update(b'\0')
+    return 'django_moj_template.fragment.%s.%s' % (name, digest.hexdigest())
+
+
+def _serialise(value):
+    """
+    Encodes a json-like value unambiguously, raising TypeError for anything else
+    as other objects' text, e.g. a default repr containing a memory address, need not identify them
+    """
+    if isinstance(value, Promise):
+        # lazy translations depend only on the active language, which is part of the key
+        value = u'%s' % value
+    if isinstance(value, dict):
+        return '{%s}' % ','.join(sorted('%s:%s' % (_serialise(key), _serialise(item))
+                                        for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return '[%s]' % ','.join(map(_serialise, value))
+    if value is None or isinstance(value, (bool, int, float) + text_types):
+        return json.dumps(value)
+    raise TypeError('%s cannot be part of a fragment cache key' % type(value).__name__)
@@ -0,0 +1,41 @@
+import os
+
+from django.template import TemplateDoesNotExist, TemplateSyntaxError, engines
+from django.template.backends.django import DjangoTemplates
+from django.template.utils import get_app_template_dirs
+
+templates_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+
+
+def find_template_names(*template_dirs):
+    names = []
+    for template_dir in template_dirs:
+        for dir_path, dir_names, file_names in os.walk(template_dir):
+            for file_name in file_names:
+                if file_name.endswith(('.html', '.txt')):
+                    name = os.path.relpath(os.path.join(dir_path, file_name), template_dir)
+                    names.append(name.replace(os.sep, '/'))
+    return names
+
+
+def warm_up_templates(include_project=False):
+    """
+    Compiles the packaged templates, and optionally all of the project's own, in every Django template engine
+    so that engines using a cached loader do not parse them on the first request
+    :return: list of (engine name, template name, error or None)
+    """
+    results = []
+    for engine in engines.all():
+        if not isinstance(engine, DjangoTemplates):
+            continue
+        template_dirs = [templates_path]
+        if include_project:
+            template_dirs.extend(engine.dirs)
+            template_dirs.extend(get_app_template_dirs('templates'))
+        for name in sorted(set(find_template_names(*template_dirs))):
+            try:
+                engine.get_template(name)
+                results.append((engine.name, name, None))
+            except (TemplateDoesNotExist, TemplateSyntaxError) as e:
+                results.append((engine.name, name, e))
+    return results
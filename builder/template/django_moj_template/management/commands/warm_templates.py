@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from django_moj_template.loaders import warm_up_templates
+
+
+class Command(BaseCommand):
+    help = 'Compiles the packaged templates, reporting any that fail and how long it took'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', dest='include_project',
+                            help='also compile the project\'s own templates')
+
+    def handle(self, *args, **options):
+        start = time.time()
+        results = warm_up_templates(include_project=options['include_project'])
+        errors = [(engine, name, error) for engine, name, error in results if error]
+        for engine, name, error in errors:
+            self.stderr.write('%s: %s – %s' % (engine, name, error))
+        self.stdout.write('Compiled %d template(s) in %.0fms' % (len(results) - len(errors),
+                                                                  (time.time() - start) * 1000))
+        if errors:
+            raise CommandError('%d template(s) could not be compiled' % len(errors))
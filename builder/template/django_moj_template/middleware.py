@@ -0,0 +1,70 @@
+from django_moj_template.static import get_preload_links
+from django_moj_template.whitespace import HTMLMinifier, minify_html
+
+try:
+    from django.utils.deprecation import MiddlewareMixin
+except ImportError:
+    MiddlewareMixin = object
+
+
+class MinifyHTMLMiddleware(MiddlewareMixin):
+    """
+    Collapses whitespace in html responses, leaving <pre>, <textarea>, <script>, <style>
+    and conditional comments alone. Streaming responses are minified chunk by chunk.
+    Add above any compressing middleware such as GZipMiddleware.
+    """
+
+    def process_response(self, request, response):
+        if response.get('Content-Encoding') or \
+                not response.get('Content-Type', '').startswith('text/html'):
+            return response
+
+        charset = getattr(response, 'charset', None) or 'utf-8'
+        if response.streaming:
+            response.streaming_content = self.minify_stream(response.streaming_content, charset)
+            # the minified length is not known in advance
+            del response['Content-Length']
+        else:
+            content = minify_html(response.content.decode(charset)).encode(charset)
+            response.content = content
+            if response.has_header('Content-Length'):
+                response['Content-Length'] = str(len(content))
+        return response
+
+    @classmethod
+    def minify_stream(cls, streaming_content, charset):
+        minifier = HTMLMinifier()
+        pending = b''
+        for chunk in streaming_content:
+            # a chunk may end part way through a multi-byte character
+            chunk = pending + chunk
+            try:
+                text = chunk.decode(charset)
+                pending = b''
+            except UnicodeDecodeError as e:
+                text = chunk[:e.start].decode(charset)
+                pending = chunk[e.start:]
+            output = minifier.feed(text)
+            if output:
+                yield output.encode(charset)
+        output = minifier.close() + pending.decode(charset, 'replace')
+        if output:
+            yield output.encode(charset)
+
+
+class PreloadHeadersMiddleware(MiddlewareMixin):
+    """
+    Adds Link preload headers to html responses for the stylesheets, scripts and fonts of the base layout
+    so that browsers fetch them while the document downloads; servers and CDNs that support
+    103 Early Hints can send these before the response
+    """
+
+    def process_response(self, request, response):
+        if not response.get('Content-Type', '').startswith('text/html'):
+            return response
+        links = get_preload_links()
+        if links:
+            if response.has_header('Link'):
+                links = [response['Link']] + links
+            response['Link'] = ', '.join(links)
+        return response
@@ -0,0 +1,186 @@
+from collections import OrderedDict
+import json
+import os
+import posixpath
+import re
+
+from django.templatetags.static import static
+
+app_path = os.path.dirname(os.path.abspath(__file__))
+manifest_path = os.path.join(app_path, 'static-manifest.json')
+responsive_images_path = os.path.join(app_path, 'responsive-images.json')
+static_root = os.path.join(app_path, 'static')
+# precompressed variants written at build time in order of preference
+encodings = (('br', '.br'), ('gzip', '.gz'))
+css_url_re = re.compile(r'''url\(\s*(?P<quote>['"]?)(?P<url>.*?)(?P=quote)\s*\)''')
+_manifest = None
+_preload_links = None
+_critical_css = {}
+_responsive_images = None
+_srcsets = {}
+# modern formats in order of preference, offered before the image's own format
+modern_image_types = ('image/avif', 'image/webp')
+
+
+def get_manifest():
+    global _manifest
+    if _manifest is None:
+        try:
+            with open(manifest_path) as f:
+                _manifest = json.load(f)
+        except (IOError, ValueError):
+            _manifest = {}
+    return _manifest
+
+
+def get_hashed_paths():
+    """
+    Returns the mapping of static file names to content-hashed names written at build time
+    """
+    return get_manifest().get('paths', {})
+
+
+def get_preload_links():
+    """
+    Returns Link header values for the assets the base layout needs, found at build time
+    """
+    global _preload_links
+    if _preload_links is None:
+        links = []
+        for asset in get_manifest().get('preload', []):
+            link = '<%s>; rel=preload; as=%s' % (hashed_static(asset['path']), asset['as'])
+            if asset['as'] == 'font':
+                link += '; type=%s; crossorigin' % ('font/woff2' if asset['path'].endswith('.woff2') else 'font/woff')
+            links.append(link)
+        _preload_links = links
+    return _preload_links
+
+
+def hashed_static(path):
+    """
+    Returns the url of a packaged static file using its content-hashed name if one was built
+    """
+    return static(get_hashed_paths().get(path, path))
+
+
+def get_critical_css(path):
+    """
+    Returns the critical css extracted at build time for a packaged stylesheet
+    with urls made absolute so that it can be inlined, or None if there is none
+    e.g. stylesheets/main.critical.css for stylesheets/main.css
+    """
+    if path not in _critical_css:
+        root, ext = posixpath.splitext(path)
+        critical_path = '%s.critical%s' % (root, ext)
+        critical_path = get_hashed_paths().get(critical_path, critical_path)
+        try:
+            with open(os.path.join(static_root, *critical_path.split('/')), 'rb') as f:
+                content = f.read().decode('utf-8')
+        except IOError:
+            content = None
+        else:
+            css_dir = posixpath.dirname(critical_path)
+
+            def make_absolute(match):
+                url = match.group('url')
+                if not url or url.startswith(('data:', '#', '/')) or '//' in url:
+                    return match.group(0)
+                url_path, suffix = re.match(r'^([^?#]*)(.*)$', url).groups()
+                url_path = posixpath.normpath(posixpath.join(css_dir, url_path))
+                return 'url(%s)' % (hashed_static(url_path) + suffix)
+
+            content = css_url_re.sub(make_absolute, content).replace('</', '<\\/')
+        _critical_css[path] = content
+    return _critical_css[path]
+
+
+def get_responsive_images():
+    """
+    Returns the index of resized image variants written at build time
+    """
+    global _responsive_images
+    if _responsive_images is None:
+        try:
+            with open(responsive_images_path) as f:
+                _responsive_images = json.load(f).get('images', {})
+        except (IOError, ValueError):
+            _responsive_images = {}
+    return _responsive_images
+
+
+def get_srcsets(path):
+    """
+    Returns the width and height of a packaged image along with a list of (content type, srcset)
+    with modern formats first and its own format last, or None if it has no variants
+    """
+    if path not in _srcsets:
+        image = get_responsive_images().get(path)
+        if image is None:
+            _srcsets[path] = None
+        else:
+            sources = image['sources']
+            content_types = [content_type for content_type in modern_image_types if content_type in sources]
+            content_types.extend(sorted(content_type for content_type in sources if content_type not in content_types))
+            _srcsets[path] = image['width'], image['height'], [
+                (content_type, ', '.join('%s %dw' % (hashed_static(variant_path), width)
+                                         for variant_path, width in sources[content_type]))
+                for content_type in content_types
+            ]
+    return _srcsets[path]
+
+
+def get_accepted_encodings(accept_encoding):
+    """
+    Returns the content codings listed in a client's Accept-Encoding header mapped to their q-values,
+    those with a q-value of 0 are refused
+    """
+    accepted = {}
+    for coding in (accept_encoding or '').split(','):
+        coding, _, params = coding.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value.strip())
+                except ValueError:
+                    quality = 0.0
+        accepted[coding] = quality
+    return accepted
+
+
+def choose_encoding(accepted, codings):
+    """
+    Returns the coding the client prefers of those available, by q-value and then in the given order
+    of the server's preference, or None if it accepts none of them
+    :param accepted: mapping returned by get_accepted_encodings
+    :param codings: available content codings, most preferred first
+    """
+    default_quality = accepted.get('*', 0.0)
+    candidates = [
+        (accepted.get(coding, default_quality), -index, coding)
+        for index, coding in enumerate(codings)
+    ]
+    candidates = [candidate for candidate in candidates if candidate[0] > 0]
+    if not candidates:
+        return None
+    return max(candidates)[2]
+
+
+def find_precompressed(full_path, accept_encoding):
+    """
+    Returns the path and content coding of the best precompressed variant of a file
+    the client accepts, or the original path and None
+    """
+    variant_paths = OrderedDict(
+        (coding, full_path + suffix)
+        for coding, suffix in encodings
+        if os.path.exists(full_path + suffix)
+    )
+    coding = choose_encoding(get_accepted_encodings(accept_encoding), list(variant_paths))
+    if coding:
+        return variant_paths[coding], coding
+    return full_path, None
@@ -1,6 +1,12 @@
-import re
-
 from django import template
+from django.conf import settings
+from django.template.base import TextNode
+from django.utils.html import format_html, format_html_join
+from django.utils.safestring import mark_safe
+
+from django_moj_template.fragment_cache import get_fragment_cache, make_fragment_key
+from django_moj_template.static import get_critical_css, get_srcsets, hashed_static
+from django_moj_template.whitespace import collapse_whitespace
 
 register = template.Library()
 
@@ -9,13 +15,40 @@ class CollapseWhitespaceNode(template.Node):
     def __init__(self, node_list, stripped):
         self.node_list = node_list
         self.stripped = stripped
+        # literal text is collapsed once when the template is compiled, recorded as (is text, text or node)
+        self.bits = [
+            (True, collapse_whitespace(node.s)) if isinstance(node, TextNode) else (False, node)
+            for node in node_list
+        ]
+        if all(is_text for is_text, _ in self.bits):
+            self.static_output = self.join_bits(bit for _, bit in self.bits)
+        else:
+            self.static_output = None
 
     def render(self, context):
-        output = self.node_list.render(context)
-        if isinstance(output, str):
-            output = re.sub(r'\s+', ' ', output)
-            if self.stripped:
-                output = output.strip()
+        if self.static_output is not None:
+            return self.static_output
+        return self.join_bits(
+            bit if is_text else collapse_whitespace(u'%s' % bit.render_annotated(context))
+            for is_text, bit in self.bits
+        )
+
+    def join_bits(self, bits):
+        """
+        Joins already collapsed strings, dropping a space where two meet
+        """
+        output = []
+        ends_with_space = False
+        for bit in bits:
+            if ends_with_space and bit.startswith(' '):
+                bit = bit[1:]
+            if not bit:
+                continue
+            output.append(bit)
+            ends_with_space = bit.endswith(' ')
+        output = ''.join(output)
+        if self.stripped:
+            output = output.strip()
         return output
 
 
@@ -37,3 +70,109 @@ def do_collapse_whitespace(parser, token):
     node_list = parser.parse(('endcollapsewhitespace',))
     parser.delete_first_token()
     return CollapseWhitespaceNode(node_list, stripped=stripped)
+
+
+@register.simple_tag(name='moj_static')
+def do_moj_static(path):
+    """
+    Like {% static %} but resolves packaged files to their content-hashed names
+    which can be cached indefinitely
+    """
+    return hashed_static(path)
+
+
+@register.simple_tag(name='critical_stylesheet')
+def do_critical_stylesheet(path, media='screen'):
+    """
+    Inlines the critical css built for a packaged stylesheet and loads the full stylesheet
+    asynchronously, falling back to a plain link if there is no critical css
+    or MOJ_TEMPLATE_INLINE_CRITICAL_CSS is False.
+    The full stylesheet is linked for print media, which browsers load without blocking rendering,
+    and switched to the intended media once loaded as not all browsers support rel=preload
+    """
+    href = hashed_static(path)
+    critical_css = None
+    if getattr(settings, 'MOJ_TEMPLATE_INLINE_CRITICAL_CSS', True):
+        critical_css = get_critical_css(path)
+    if not critical_css:
+        return format_html('<link href="{}" media="{}" rel="stylesheet" type="text/css" />', href, media)
+    return format_html(
+        '<style media="{media}">{critical_css}</style>'
+        '<link href="{href}" media="print" rel="stylesheet" type="text/css"'
+        ' onload="this.onload=null;this.media=\'{media}\'" />'
+        '<noscript><link href="{href}" media="{media}" rel="stylesheet" type="text/css" /></noscript>',
+        href=href, media=media, critical_css=mark_safe(critical_css),
+    )
+
+
+@register.simple_tag(name='javascript_bundle')
+def do_javascript_bundle(name):
+    """
+    Loads a script bundle built with the package, e.g. 'govuk-template' or 'govuk-toolkit',
+    deferred so that it does not block parsing the page
+    """
+    return format_html('<script src="{}" defer></script>', hashed_static('javascripts/%s.bundle.js' % name))
+
+
+@register.simple_tag(name='responsive_image')
+def do_responsive_image(path, alt='', sizes='100vw', **attrs):
+    """
+    Renders a packaged image with srcset and sizes listing the variants built for it,
+    within a picture element offering modern formats first, e.g.
+    {% responsive_image 'images/example.png' alt='Example' sizes='(min-width: 641px) 50vw, 100vw' class='x' %}
+    falls back to a plain img if no variants were built
+    """
+    attributes = format_html_join('', ' {}="{}"', sorted(attrs.items()))
+    srcsets = get_srcsets(path)
+    if not srcsets:
+        return format_html('<img src="{}" alt="{}"{} />', hashed_static(path), alt, attributes)
+    width, height, sources = srcsets
+    img = format_html(
+        '<img src="{src}" srcset="{srcset}" sizes="{sizes}"'
+        ' width="{width}" height="{height}" alt="{alt}"{attributes} />',
+        src=hashed_static(path), srcset=sources[-1][1], sizes=sizes, width=width, height=height, alt=alt,
+        attributes=attributes,
+    )
+    if len(sources) == 1:
+        return img
+    return format_html(
+        '<picture>{sources}{img}</picture>',
+        sources=format_html_join('', '<source type="{}" srcset="{}" sizes="{}" />',
+                                 ((content_type, srcset, sizes) for content_type, srcset in sources[:-1])),
+        img=img,
+    )
+
+
+class FragmentCacheNode(template.Node):
+    def __init__(self, node_list, name, vary_on):
+        self.node_list = node_list
+        self.name = name
+        self.vary_on = vary_on
+
+    def render(self, context):
+        cache = get_fragment_cache()
+        if cache is None:
+            return self.node_list.render(context)
+        key = make_fragment_key(self.name, [value.resolve(context) for value in self.vary_on])
+        if key is None:
+            return self.node_list.render(context)
+        output = cache.get(key)
+        if output is None:
+            output = self.node_list.render(context)
+            cache.set(key, output)
+        return output
+
+
+@register.tag(name='fragmentcache')
+def do_fragment_cache(parser, token):
+    """
+    Caches a fragment of the layout keyed on its name, the active language,
+    the package build and any given values, which must be json-like to be cached, e.g.
+    {% fragmentcache 'footer' footer_support_links %}…{% endfragmentcache %}
+    """
+    args = token.split_contents()[1:]
+    if not args or args[0][0] not in '"\'' or args[0][0] != args[0][-1]:
+        raise template.TemplateSyntaxError('"fragmentcache" requires a quoted fragment name')
+    node_list = parser.parse(('endfragmentcache',))
+    parser.delete_first_token()
+    return FragmentCacheNode(node_list, args[0][1:-1], [parser.compile_filter(arg) for arg in args[1:]])
@@ -0,0 +1,40 @@
+import mimetypes
+import os
+import posixpath
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+from django_moj_template.static import find_precompressed, static_root
+
+
+def serve(request, path):
+    """
+    Serves packaged static files, choosing a precompressed variant according to Accept-Encoding
+    e.g. url(r'^static/(?P<path>.*)$', serve)
+    """
+    path = posixpath.normpath(path).lstrip('/')
+    try:
+        full_path = safe_join(static_root, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not os.path.isfile(full_path):
+        raise Http404
+
+    served_path, coding = find_precompressed(full_path, request.META.get('HTTP_ACCEPT_ENCODING'))
+    stat = os.stat(served_path)
+    # the size argument was removed in Django 4.1
+    if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), stat.st_mtime):
+        response = HttpResponseNotModified()
+    else:
+        content_type, _ = mimetypes.guess_type(full_path)
+        response = FileResponse(open(served_path, 'rb'), content_type=content_type or 'application/octet-stream')
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        response['Content-Length'] = stat.st_size
+        if coding:
+            response['Content-Encoding'] = coding
+    response['Vary'] = 'Accept-Encoding'
+    return response
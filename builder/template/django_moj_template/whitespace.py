@@ -0,0 +1,84 @@
+import re
+
+whitespace_re = re.compile(r'\s+')
+# elements and comments whose content must be left as is
+preserved_start_re = re.compile(r'<(pre|textarea|script|style)\b|<!--\[if\b', re.I)
+preserved_end_res = {
+    'pre': re.compile(r'</pre\s*>', re.I),
+    'textarea': re.compile(r'</textarea\s*>', re.I),
+    'script': re.compile(r'</script\s*>', re.I),
+    'style': re.compile(r'</style\s*>', re.I),
+    'comment': re.compile(r'<!\[endif\]-->', re.I),
+}
+
+
+def collapse_whitespace(text):
+    return whitespace_re.sub(' ', text)
+
+
+class HTMLMinifier:
+    """
+    Collapses whitespace in html fed to it in chunks, leaving preformatted text,
+    scripts, styles and conditional comments untouched
+    """
+
+    def __init__(self):
+        self.buffer = ''
+        self.ends_with_space = False
+
+    def feed(self, chunk):
+        """
+        Returns minified html that is complete so far, holding back anything that may continue in the next chunk
+        """
+        self.buffer += chunk
+        output = []
+        while True:
+            match = preserved_start_re.search(self.buffer)
+            if not match:
+                break
+            end_re = preserved_end_res[(match.group(1) or 'comment').lower()]
+            end_match = end_re.search(self.buffer, match.end())
+            if not end_match:
+                # wait for the end of the preserved section
+                output.append(self.collapse(self.buffer[:match.start()]))
+                self.buffer = self.buffer[match.start():]
+                return ''.join(output)
+            output.append(self.collapse(self.buffer[:match.start()]))
+            output.append(self.preserve(self.buffer[match.start():end_match.end()]))
+            self.buffer = self.buffer[end_match.end():]
+
+        # a tag that opens a preserved section or a run of whitespace may be split across chunks
+        hold_from = self.buffer.rfind('<')
+        if hold_from == -1 or '>' in self.buffer[hold_from:]:
+            hold_from = len(self.buffer.rstrip())
+        output.append(self.collapse(self.buffer[:hold_from]))
+        self.buffer = self.buffer[hold_from:]
+        return ''.join(output)
+
+    def close(self):
+        """
+        Returns whatever remains, unfinished preserved sections are left as they are
+        """
+        buffer, self.buffer = self.buffer, ''
+        if preserved_start_re.match(buffer):
+            return self.preserve(buffer)
+        return self.collapse(buffer)
+
+    def collapse(self, text):
+        if not text:
+            return ''
+        text = collapse_whitespace(text)
+        if self.ends_with_space and text.startswith(' '):
+            text = text[1:]
+        if text:
+            self.ends_with_space = text.endswith(' ')
+        return text
+
+    def preserve(self, text):
+        self.ends_with_space = False
+        return text
+
+
+def minify_html(html):
+    minifier = HTMLMinifier()
+    return minifier.feed(html) + minifier.close()
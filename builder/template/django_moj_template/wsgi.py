@@ -0,0 +1,180 @@
+from email.utils import mktime_tz, parsedate_tz
+import mimetypes
+import os
+import re
+from wsgiref.handlers import format_date_time
+
+from django_moj_template.static import choose_encoding, encodings, get_accepted_encodings, get_hashed_paths, static_root
+
+range_re = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class StaticFile(object):
+    def __init__(self, path, stat, content_type, cache_control, coding=None):
+        self.path = path
+        self.size = stat.st_size
+        self.last_modified = format_date_time(stat.st_mtime)
+        self.mtime = int(stat.st_mtime)
+        self.etag = '"%x-%x%s"' % (self.mtime, self.size, '-%s' % coding if coding else '')
+        self.content_type = content_type
+        self.cache_control = cache_control
+        self.coding = coding
+        self.variants = []
+
+
+class StaticFilesApplication(object):
+    """
+    WSGI application serving the packaged static files, passing any other request to the wrapped application.
+    Files are indexed once when created. Precompressed variants are chosen according to Accept-Encoding,
+    conditional and range requests are supported and content-hashed files are cached for a year.
+    e.g. in wsgi.py: application = StaticFilesApplication(get_wsgi_application())
+    """
+    hashed_cache_control = 'public, max-age=31536000, immutable'
+    cache_control = 'public, max-age=3600'
+    block_size = 64 * 1024
+
+    def __init__(self, application, prefix=None, root=static_root):
+        if prefix is None:
+            from django.conf import settings
+
+            prefix = settings.STATIC_URL
+        self.application = application
+        self.prefix = '/' + prefix.strip('/') + '/'
+        self.files = self.build_index(root)
+
+    def build_index(self, root):
+        hashed_paths = set(get_hashed_paths().values())
+        suffixes = tuple(suffix for _, suffix in encodings)
+        files = {}
+        for dir_path, dir_names, file_names in os.walk(root):
+            for file_name in file_names:
+                if file_name.endswith(suffixes):
+                    continue
+                full_path = os.path.join(dir_path, file_name)
+                path = os.path.relpath(full_path, root).replace(os.sep, '/')
+                content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+                if content_type.startswith('text/') or content_type.endswith(('javascript', 'json', '+xml')):
+                    content_type += '; charset=utf-8'
+                cache_control = self.hashed_cache_control if path in hashed_paths else self.cache_control
+                static_file = StaticFile(full_path, os.stat(full_path), content_type, cache_control)
+                for coding, suffix in encodings:
+                    if os.path.exists(full_path + suffix):
+                        static_file.variants.append(StaticFile(full_path + suffix, os.stat(full_path + suffix),
+                                                               content_type, cache_control, coding))
+                files[path] = static_file
+        return files
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if not path.startswith(self.prefix) or environ['REQUEST_METHOD'] not in ('GET', 'HEAD'):
+            return self.application(environ, start_response)
+        try:
+            path = path[len(self.prefix):].encode('latin-1').decode('utf-8')
+        except UnicodeError:
+            return self.application(environ, start_response)
+        static_file = self.files.get(path)
+        if static_file is None:
+            return self.application(environ, start_response)
+        return self.serve(static_file, environ, start_response)
+
+    def serve(self, static_file, environ, start_response):
+        byte_range = self.get_range(static_file, environ)
+        if not byte_range and static_file.variants:
+            coding = choose_encoding(get_accepted_encodings(environ.get('HTTP_ACCEPT_ENCODING')),
+                                     [variant.coding for variant in static_file.variants])
+            served_file = next((variant for variant in static_file.variants if variant.coding == coding),
+                               static_file)
+        else:
+            served_file = static_file
+
+        headers = [
+            ('Cache-Control', served_file.cache_control),
+            ('ETag', served_file.etag),
+            ('Last-Modified', served_file.last_modified),
+        ]
+        if static_file.variants:
+            headers.append(('Vary', 'Accept-Encoding'))
+        if self.is_not_modified(served_file, environ):
+            start_response('304 Not Modified', headers)
+            return []
+
+        headers.extend([
+            ('Content-Type', served_file.content_type),
+            ('Accept-Ranges', 'bytes'),
+        ])
+        if served_file.coding:
+            headers.append(('Content-Encoding', served_file.coding))
+        if byte_range == 'unsatisfiable':
+            headers.append(('Content-Range', 'bytes */%d' % served_file.size))
+            start_response('416 Range Not Satisfiable', headers)
+            return []
+
+        start, end = byte_range or (0, served_file.size - 1)
+        headers.append(('Content-Length', str(end - start + 1)))
+        if byte_range:
+            headers.append(('Content-Range', 'bytes %d-%d/%d' % (start, end, served_file.size)))
+            start_response('206 Partial Content', headers)
+        else:
+            start_response('200 OK', headers)
+        if environ['REQUEST_METHOD'] == 'HEAD':
+            return []
+
+        f = open(served_file.path, 'rb')
+        if byte_range:
+            f.seek(start)
+            return self.read_range(f, end - start + 1)
+        file_wrapper = environ.get('wsgi.file_wrapper')
+        if file_wrapper:
+            # lets the server use sendfile
+            return file_wrapper(f, self.block_size)
+        return self.read_range(f, served_file.size)
+
+    def read_range(self, f, length):
+        try:
+            while length > 0:
+                block = f.read(min(length, self.block_size))
+                if not block:
+                    break
+                length -= len(block)
+                yield block
+        finally:
+            f.close()
+
+    @classmethod
+    def is_not_modified(cls, served_file, environ):
+        if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+        if if_none_match:
+            etags = [etag.strip() for etag in if_none_match.split(',')]
+            return '*' in etags or any(etag.lstrip('W/') == served_file.etag for etag in etags)
+        if_modified_since = environ.get('HTTP_IF_MODIFIED_SINCE')
+        if if_modified_since:
+            date = parsedate_tz(if_modified_since)
+            return date is not None and served_file.mtime <= mktime_tz(date)
+        return False
+
+    @classmethod
+    def get_range(cls, static_file, environ):
+        """
+        Returns the (start, end) of a single requested byte range, 'unsatisfiable' or None to send the whole file
+        """
+        range_header = environ.get('HTTP_RANGE')
+        if not range_header:
+            return None
+        if_range = environ.get('HTTP_IF_RANGE')
+        if if_range and if_range != static_file.etag and if_range != static_file.last_modified:
+            return None
+        match = range_re.match(range_header.strip())
+        if not match:
+            # multiple or malformed ranges are ignored
+            return None
+        start, end = match.groups()
+        size = static_file.size
+        if not start:
+            if not end or not int(end):
+                return 'unsatisfiable'
+            start, end = max(size - int(end), 0), size - 1
+        else:
+            start, end = int(start), min(int(end), size - 1) if end else size - 1
+        if start >= size or start > end:
+            return 'unsatisfiable'
+        return start, end
@@ -2,6 +2,8 @@ import os
 
 from setuptools import setup
 
+from django_moj_template import __version__
+
 # allow setup.py to be run from any path
 os.chdir(os.path.normpath(os.path.join(os.path.abspath(__file__), os.pardir)))
 
@@ -10,7 +12,7 @@ with open('README.md') as readme:
 
 setup(
     name='django-moj-template',
-    version='0.1',
+    version=__version__,
     author='Ministry of Justice Digital Services',
     url='https://github.com/ministryofjustice/django-moj-template',
     packages=['django_moj_template'],
@@ -1,5 +1,13 @@
+import contextlib
+import fcntl
 import functools
+import hashlib
+import json
+import os
+import subprocess
 import sys
+import threading
+import time
 
 
 def announce_calls(announcement=None, after_call=False, bold=True):
@@ -19,7 +27,8 @@ def announce_calls(announcement=None, after_call=False, bold=True):
         def wrapped_func(*args, **kwargs):
             if message and not after_call:
                 print(term_bold(message), file=sys.stdout)
-            result = func(*args, **kwargs)
+            with profiler.record(func.__name__, 'stage'):
+                result = func(*args, **kwargs)
             if message and after_call:
                 print(term_bold(message), file=sys.stdout)
             return result
@@ -29,6 +38,120 @@ def announce_calls(announcement=None, after_call=False, bold=True):
     return decorator
 
 
+class Profiler:
+    """
+    Records how long build stages and commands take, and the peak memory of commands
+    """
+
+    def __init__(self):
+        self.start_time = time.time()
+        self.records = []
+        self.lock = threading.Lock()
+
+    def record(self, name, category, **details):
+        return ProfilerRecord(self, name, category, details)
+
+    def add(self, record):
+        with self.lock:
+            self.records.append(record)
+
+    def print_summary(self):
+        if not self.records:
+            return
+        print(term_bold('Timings'))
+        name_length = max(len(record.name) for record in self.records)
+        for record in sorted(self.records, key=lambda record: record.start):
+            max_rss = record.details.get('max_rss_kb')
+            print('  %s%s %8.2fs%s' % (
+                '  ' if record.category == 'command' else '',
+                record.name.ljust(name_length), record.duration,
+                '  %6.0f MB peak' % (max_rss / 1024) if max_rss else '',
+            ))
+
+    def write_trace(self, path):
+        """
+        Writes records in Chrome's trace event format, viewable in chrome://tracing
+        """
+        thread_ids = {}
+        events = []
+        for record in self.records:
+            events.append({
+                'name': record.name,
+                'cat': record.category,
+                'ph': 'X',
+                'ts': int((record.start - self.start_time) * 1000000),
+                'dur': int(record.duration * 1000000),
+                'pid': os.getpid(),
+                'tid': thread_ids.setdefault(record.thread_id, len(thread_ids)),
+                'args': record.details,
+            })
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f, indent=1)
+
+
+class ProfilerRecord:
+    def __init__(self, profiler, name, category, details):
+        self.profiler = profiler
+        self.name = name
+        self.category = category
+        self.details = details
+        self.thread_id = threading.get_ident()
+        self.start = None
+        self.duration = None
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.duration = time.time() - self.start
+        if exc_type is not None:
+            self.details['failed'] = True
+        self.profiler.add(self)
+
+
+profiler = Profiler()
+
+
+def check_call(cmd, cwd=None, env=None):
+    """
+    Like subprocess.check_call but recording duration and peak memory use of the command
+    """
+    name = [cmd[0]]
+    for arg in cmd[1:3]:
+        if arg.startswith('-') or os.sep in arg:
+            break
+        name.append(arg)
+    name = ' '.join(name)
+    with profiler.record(name, 'command', cmd=cmd, cwd=cwd) as record:
+        process = subprocess.Popen(cmd, cwd=cwd, env=env)
+        if hasattr(os, 'wait4'):
+            _, status, usage = os.wait4(process.pid, 0)
+            process.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+            # ru_maxrss is in kilobytes on linux but bytes on mac os
+            record.details['max_rss_kb'] = usage.ru_maxrss / 1024 if sys.platform == 'darwin' else usage.ru_maxrss
+        else:
+            process.wait()
+        if process.returncode:
+            raise subprocess.CalledProcessError(process.returncode, cmd)
+
+
+@contextlib.contextmanager
+def file_lock(path):
+    """
+    Holds an exclusive lock on a file, created if needed,
+    so that builds sharing a cache folder, or threads of one build, take turns
+    :param path: the lock file
+    """
+    os.makedirs(os.path.dirname(path), 0o755, exist_ok=True)
+    with open(path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
 def requisites(*prerequisites):
     """
     A decorator to call pre-requisites before proceeding.
@@ -85,3 +208,40 @@ def one_line_doc(obj):
     doc = getattr(obj, '__doc__', None) or ''
     doc = doc.strip().splitlines()
     return doc[0] if doc else ''
+
+
+def format_size(size):
+    """
+    Returns a byte count in the largest unit it is at least 1 of
+    """
+    if abs(size) < 1024:
+        return '%d bytes' % size
+    for unit in ('KB', 'MB'):
+        size /= 1024
+        if abs(size) < 1024:
+            return '%.1f %s' % (size, unit)
+    return '%.1f GB' % (size / 1024)
+
+
+def hash_paths(*paths, exclude=('.git', '.sass-cache', 'node_modules')):
+    """
+    Returns a digest of the relative names and contents of all files under the given paths
+    :param paths: files or folders to hash
+    :param exclude: folder names that are not descended into
+    """
+    digest = hashlib.sha1()
+    for root_path in paths:
+        if os.path.isfile(root_path):
+            file_paths = [root_path]
+        else:
+            file_paths = []
+            for dir_path, dir_names, file_names in os.walk(root_path):
+                dir_names[:] = sorted(name for name in dir_names if name not in exclude)
+                file_paths.extend(os.path.join(dir_path, file_name) for file_name in sorted(file_names))
+        for file_path in file_paths:
+            digest.update(os.path.relpath(file_path, root_path).encode('utf-8'))
+            digest.update(b'\0')
+            with open(file_path, 'rb') as f:
+                for block in iter(lambda: f.read(65536), b''):
+                    digest.update(block)
+    return digest.hexdigest()
@@ -3,8 +3,8 @@ import os
 import sys
 
 if __name__ == '__main__':
-    if sys.version_info[:2] < (3, 4):
-        sys.exit('Python version must be at least 3.4')
+    if sys.version_info[:2] < (3, 5):
+        sys.exit('Python version must be at least 3.5')
 
     from builder import Builder
 
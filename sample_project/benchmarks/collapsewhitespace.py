@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+"""
+Compares rendering large blocks wrapped in {% collapsewhitespace %}
+using the original render-then-substitute implementation and the current one
+"""
+import argparse
+import os
+import re
+import sys
+import timeit
+
+import django
+from django.conf import settings
+
+
+def legacy_render(self, context):
+    output = self.node_list.render(context)
+    if isinstance(output, str):
+        output = re.sub(r'\s+', ' ', output)
+        if self.stripped:
+            output = output.strip()
+    return output
+
+
+def make_template_source(paragraphs, dynamic):
+    paragraph = '''
+        <p class="lede">
+            Cras justo odio,   dapibus ac facilisis in,
+            egestas eget quam. %s
+        </p>
+    ''' % ('{{ value }}' if dynamic else 'Vivamus sagittis lacus.')
+    return '{% load django_moj_template %}{% collapsewhitespace stripped %}' + \
+           paragraph * paragraphs + \
+           '{% endcollapsewhitespace %}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--paragraphs', type=int, default=1000)
+    parser.add_argument('--number', type=int, default=200)
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    settings.configure(
+        INSTALLED_APPS=['django_moj_template'],
+        TEMPLATES=[{'BACKEND': 'django.template.backends.django.DjangoTemplates', 'APP_DIRS': True}],
+    )
+    django.setup()
+
+    from django.template import Context, engines
+    from django_moj_template.templatetags.django_moj_template import CollapseWhitespaceNode
+
+    engine = engines['django'].engine
+    current_render = CollapseWhitespaceNode.render
+    for dynamic in (False, True):
+        template = engine.from_string(make_template_source(args.paragraphs, dynamic))
+        context = Context({'value': '  Vivamus\n  sagittis  lacus. '})
+        results = {}
+        for name, render in (('before', legacy_render), ('after', current_render)):
+            CollapseWhitespaceNode.render = render
+            results[name] = min(timeit.repeat(lambda: template.render(context), number=args.number, repeat=3))
+            results[name + '_output'] = template.render(context)
+        CollapseWhitespaceNode.render = current_render
+        assert results['before_output'] == results['after_output'], 'Outputs differ'
+
+        print('%s block of %d paragraphs: before %.3fms, after %.3fms per render' % (
+            'Dynamic' if dynamic else 'Literal', args.paragraphs,
+            1000 * results['before'] / args.number, 1000 * results['after'] / args.number,
+        ))
+
+
+if __name__ == '__main__':
+    main()
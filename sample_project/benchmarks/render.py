@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+"""
+Measures rendering the sample app's index page, which extends django_moj_template/base.html,
+with varying proposition links, context processors and languages.
+Results are written as json so that they can be compared between package versions.
+"""
+import argparse
+import copy
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+sample_project_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+link_counts = {'none': 0, 'one': 1, 'many': 12}
+current_link_count = 0
+
+
+def sample_context(request):
+    """
+    The sample project's context processor with a varying number of proposition links
+    """
+    from context_processors import sample_context as original_sample_context
+
+    context = original_sample_context(request)
+    context['proposition'] = dict(context['proposition'], links=[
+        {'name': 'Link #%d' % index, 'url': '#', 'active': index == 0}
+        for index in range(current_link_count)
+    ])
+    return context
+
+
+def get_variants():
+    from django.conf import settings
+
+    context_processors = settings.TEMPLATES[0]['OPTIONS']['context_processors']
+    context_processors = [
+        '__main__.sample_context' if path == 'context_processors.sample_context' else path
+        for path in context_processors
+    ]
+    processor_sets = [('all', context_processors)]
+    processor_sets.extend(
+        ('without %s' % path.rsplit('.', 1)[-1], [other for other in context_processors if other != path])
+        for path in context_processors
+    )
+    for language in ('en', 'cy'):
+        for links_name, link_count in link_counts.items():
+            for processors_name, processors in processor_sets:
+                yield {
+                    'language': language,
+                    'links': links_name,
+                    'link_count': link_count,
+                    'context_processors': processors_name,
+                    'context_processor_paths': processors,
+                }
+
+
+def make_engine(context_processors):
+    """
+    Returns a template engine with the given context processors that caches compiled templates
+    even if DEBUG is on, so that warm renders do not parse the layouts again
+    """
+    from django.conf import settings
+    from django.template.backends.django import DjangoTemplates
+    from django_moj_template import cached_template_loaders
+
+    params = copy.deepcopy(settings.TEMPLATES[0])
+    params.pop('BACKEND')
+    params.setdefault('NAME', 'benchmark')
+    params['APP_DIRS'] = False
+    params['OPTIONS']['context_processors'] = context_processors
+    params['OPTIONS']['loaders'] = cached_template_loaders(debug=False)
+    return DjangoTemplates(params)
+
+
+def clear_caches():
+    """
+    Forgets rendered layout fragments and memoised contexts so that a render starts cold
+    """
+    from django_moj_template.fragment_cache import get_fragment_cache
+
+    cache = get_fragment_cache()
+    if cache is not None:
+        cache.clear()
+    # contexts are only memoised once the context processors module is used
+    context_processors = sys.modules.get('django_moj_template.context_processors')
+    if context_processors:
+        context_processors.clear_contexts()
+
+
+def measure(variant, request, cold_repeats, warm_repeats):
+    global current_link_count
+    from django.utils import translation
+
+    current_link_count = variant['link_count']
+    with translation.override(variant['language']):
+        cold_times = []
+        for _ in range(cold_repeats):
+            clear_caches()
+            start = time.perf_counter()
+            engine = make_engine(variant['context_processor_paths'])
+            engine.get_template('index.html').render({}, request)
+            cold_times.append(time.perf_counter() - start)
+
+        template = engine.get_template('index.html')
+        template.render({}, request)
+        warm_times = []
+        start_all = time.perf_counter()
+        for _ in range(warm_repeats):
+            start = time.perf_counter()
+            template.render({}, request)
+            warm_times.append(time.perf_counter() - start)
+        total_time = time.perf_counter() - start_all
+
+        tracemalloc.start()
+        baseline_bytes, _ = tracemalloc.get_traced_memory()
+        output = template.render({}, request)
+        current_bytes, peak_bytes = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    warm_times.sort()
+    return {
+        'language': variant['language'],
+        'links': variant['links'],
+        'context_processors': variant['context_processors'],
+        'cold_ms': 1000 * statistics.median(cold_times),
+        'warm_ms': 1000 * statistics.median(warm_times),
+        'warm_p95_ms': 1000 * warm_times[int(len(warm_times) * 0.95) - 1],
+        'renders_per_second': warm_repeats / total_time,
+        'peak_allocated_bytes': peak_bytes - baseline_bytes,
+        'retained_bytes': current_bytes - baseline_bytes,
+        'output_bytes': len(output.encode('utf-8')),
+    }
+
+
+def variant_name(result):
+    return '%(language)s / %(links)s links / %(context_processors)s' % result
+
+
+def compare(results, previous_results, threshold):
+    previous_results = {variant_name(result): result for result in previous_results}
+    regressions = []
+    for result in results:
+        previous = previous_results.get(variant_name(result))
+        if not previous:
+            continue
+        for metric in ('cold_ms', 'warm_ms', 'peak_allocated_bytes'):
+            if previous[metric] and result[metric] > previous[metric] * (1 + threshold / 100):
+                regressions.append('%s: %s %.2f → %.2f' % (variant_name(result), metric,
+                                                           previous[metric], result[metric]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--output', default='benchmark-results.json', help='path to write json results to')
+    parser.add_argument('--compare', metavar='PATH', help='previous results to check for regressions')
+    parser.add_argument('--threshold', type=float, default=10, help='percentage slow-down counted as a regression')
+    parser.add_argument('--cold-repeats', type=int, default=5)
+    parser.add_argument('--warm-repeats', type=int, default=200)
+    parser.add_argument('--no-fragment-cache', action='store_true', help='disable layout fragment caching')
+    args = parser.parse_args()
+
+    sys.path.insert(0, sample_project_path)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
+    import django
+    from django.conf import settings
+
+    django.setup()
+    if args.no_fragment_cache:
+        settings.MOJ_TEMPLATE_FRAGMENT_CACHE = False
+
+    import django_moj_template
+    from django.test import RequestFactory
+
+    request = RequestFactory().get('/')
+    results = []
+    for variant in get_variants():
+        result = measure(variant, request, args.cold_repeats, args.warm_repeats)
+        results.append(result)
+        print('%-60s cold %7.2fms  warm %6.2fms  %7.0f/s  %8d bytes peak' % (
+            variant_name(result), result['cold_ms'], result['warm_ms'],
+            result['renders_per_second'], result['peak_allocated_bytes'],
+        ))
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'django_moj_template': getattr(django_moj_template, '__version__', None),
+                'fragment_cache': not args.no_fragment_cache,
+            },
+            'results': results,
+        }, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f)['results'], args.threshold)
+        if regressions:
+            print('Regressions:')
+            print('\n'.join('  %s' % regression for regression in regressions))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
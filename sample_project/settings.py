@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/1.9/ref/settings/
 
 import os
 
+import django_moj_template
+
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
@@ -58,8 +60,8 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
+            'loaders': django_moj_template.cached_template_loaders(debug=DEBUG),
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -74,6 +76,9 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'wsgi.application'
 
+# compile packaged templates when each process starts
+MOJ_TEMPLATE_WARM_UP = not DEBUG
+
 
 # Database
 # https://docs.djangoproject.com/en/1.9/ref/settings/#databases
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
 
 application = get_wsgi_application()
+
+# serve packaged static files without a separate web server
+from django_moj_template.wsgi import StaticFilesApplication  # noqa
+
+application = StaticFilesApplication(application)